@@ -0,0 +1,271 @@
+"""
+Benchmarks for content_ingester.py.
+
+Usage:
+    python benchmark.py report [--sources 20] [--chars 50000] [--browser]
+    python benchmark.py pdf [--pages 2000] [--processes 1,2,4,8] [--file big.pdf]
+    python benchmark.py ocr [--images 120]
+"""
+import os
+import io
+import re
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import content_ingester as ci
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(x)) for x in col) for col in zip(headers, *rows)]
+    fmt = "  ".join(f"{{:>{w}}}" for w in widths)
+    print(fmt.format(*headers))
+    for row in rows:
+        print(fmt.format(*row))
+
+
+# ==========================================
+# REPORT
+# ==========================================
+class _TagCounter(HTMLParser):
+    """Counts elements the browser must build on load (script/style bodies are raw text)."""
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.count += 1
+
+
+def _synthetic_sources(n, chars):
+    line = "Milvus QPS 1200, Recall 0.95 — 向量数据库性能测试与分析。<tag> & \"quotes\"\n"
+    body = (line * (chars // len(line) + 1))[:chars]
+    return [f"Title: Source {i+1}\nSource: Benchmark\nDate: 2026-01-01\n\n=== CONTENT ===\n{body}" for i in range(n)]
+
+
+def _browser_load_ms(path, timeout):
+    """Load time in a headless browser via DrissionPage, or None if unavailable."""
+    ChromiumPage, ChromiumOptions = ci.BrowserDriver.lazy_import_drission()
+    if not ChromiumPage:
+        return None
+    page = None
+    try:
+        co = ChromiumOptions()
+        browser = ci.Config.get_browser_path()
+        if browser and os.path.exists(browser):
+            co.set_browser_path(browser)
+        co.headless(True)
+        co.set_argument('--no-sandbox')
+        page = ChromiumPage(co)
+        page.get("file:///" + os.path.abspath(path).lstrip("/"), timeout=timeout)
+        return page.run_js("const n = performance.getEntriesByType('navigation')[0]; return n.loadEventEnd || n.duration;")
+    except Exception as e:
+        ci.log_warning(f"Browser measurement failed: {e}")
+        return None
+    finally:
+        if page:
+            try: page.quit()
+            except Exception: pass
+
+
+def bench_report(args):
+    contents = _synthetic_sources(args.sources, args.chars)
+    conflicts = [f"Conflict in 'QPS': Source {i} says 1200, Source {i+1} says 900" for i in range(1, 6)]
+    rg = ci.ReportGenerator(title="Benchmark", theme="modern")
+
+    variants = {
+        "glass (CDN)": lambda: rg.generate_html(contents, conflicts),
+        "offline": lambda: "".join(rg.generate_offline_html(contents, conflicts)),
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, render in variants.items():
+            times = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                doc = render()
+                times.append(time.perf_counter() - t)
+            path = os.path.join(tmp, name.split()[0] + ".html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(doc)
+
+            counter = _TagCounter()
+            counter.feed(doc)
+            external = len(re.findall(r'(?:src|href)="https?://', doc))
+            load_ms = _browser_load_ms(path, args.timeout) if args.browser else None
+            rows.append([name, f"{len(doc.encode('utf-8')) / 1024:.1f}", f"{min(times) * 1000:.1f}",
+                         counter.count, external, "-" if load_ms is None else f"{load_ms:.0f}"])
+
+    print(f"\nReport benchmark: {args.sources} sources x {args.chars} chars (best of {args.repeat})")
+    print_table(["variant", "size KiB", "generate ms", "initial elements", "network refs", "browser load ms"], rows)
+    print("Note: the CDN report embeds only the first 2000 chars of each source; the offline report embeds all of it, lazily rendered.")
+
+
+# ==========================================
+# PDF TEXT EXTRACTION
+# ==========================================
+def _synthetic_pdf(path, pages, lines):
+    """Writes a text-only PDF (Helvetica, `lines` lines per page) without extra dependencies."""
+    words = "Milvus QPS 1200 recall 0.95 latency 12ms vector index HNSW IVF_FLAT segment compaction".split()
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for i in range(pages):
+        ops = []
+        for j in range(lines):
+            text = " ".join(words[(i + j + k) % len(words)] for k in range(12))
+            ops.append(f"BT /F1 10 Tf 40 {780 - j * 14} Td (Page {i+1} line {j+1}: {text}) Tj ET")
+        stream = "\n".join(ops)
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for n, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _thread_extract(path, workers):
+    # The pre-existing path: one shared PdfReader, pages fanned out over threads
+    reader = ci.pypdf.PdfReader(path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda page: page.extract_text() or "", reader.pages))
+
+
+def bench_pdf(args):
+    cpus = os.cpu_count() or 1
+    counts = [int(x) for x in args.processes.split(",")] if args.processes else \
+        sorted({1, cpus} | {2 ** k for k in range(1, 8) if 2 ** k < cpus})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, "synthetic.pdf")
+            _synthetic_pdf(path, args.pages, args.lines)
+        num_pages = len(ci.pypdf.PdfReader(path).pages)
+
+        def best(fn):
+            times, result = [], None
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                result = fn()
+                times.append(time.perf_counter() - t)
+            return min(times), result
+
+        base_time, expected = best(lambda: _thread_extract(path, cpus))
+        rows = [["threads (shared reader)", cpus, f"{base_time:.2f}", f"{num_pages / base_time:.0f}", "1.00x", "-"]]
+        for n in counts:
+            with ci.new_process_pool(n) as pool:
+                # Worker start-up is paid once per run (once per daemon with the shared pool): keep it out
+                ci.wait([pool.submit(os.getpid) for _ in range(n)])
+                t, pages = best(lambda: ci.extract_pdf_text_parallel(pool, path, num_pages))
+            same = [p[0] for p in pages] == expected
+            rows.append(["processes (page ranges)", n, f"{t:.2f}", f"{num_pages / t:.0f}", f"{base_time / t:.2f}x",
+                         "yes" if same else "NO"])
+
+    size_mb = os.path.getsize(args.file) / 1e6 if args.file else None
+    print(f"\nPDF text extraction: {num_pages} pages{f' ({size_mb:.1f} MB)' if size_mb else ''}, "
+          f"{cpus} CPU(s), best of {args.repeat}")
+    print_table(["mode", "workers", "seconds", "pages/s", "speedup", "same text"], rows)
+    if cpus == 1:
+        print("Note: only one CPU is available here, so process scaling cannot show; run on a multi-core machine.")
+
+
+# ==========================================
+# OCR: PER-IMAGE VS BATCHED
+# ==========================================
+def _synthetic_images(n):
+    """PNG bytes shaped like the small images found in documents: formula snippets, labels, short paragraphs."""
+    from PIL import Image, ImageDraw, ImageFont
+    snippets = ["E = mc^2", "QPS 1200", "def search(q, k=10):", "Recall@10 = 0.95", "HNSW M=16 ef=200",
+                "SELECT * FROM items", "latency p99 12ms", "x = softmax(QK^T / sqrt(d))"]
+    images = []
+    for i in range(n):
+        lines = [snippets[(i + k) % len(snippets)] for k in range(1 + i % 3)]
+        font = ImageFont.load_default(size=22 + (i % 4) * 4)
+        width = max(int(font.getlength(line)) for line in lines) + 40
+        img = Image.new("RGB", (width, 20 + len(lines) * (font.size + 12)), "white")
+        draw = ImageDraw.Draw(img)
+        for k, line in enumerate(lines):
+            draw.text((20, 10 + k * (font.size + 12)), line, fill="black", font=font)
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        images.append(buf.getvalue())
+    return images
+
+
+def bench_ocr(args):
+    cp = ci.ContentParser()
+    engine = cp.get_ocr_engine()
+    if not engine:
+        print("OCR engine not available.")
+        return
+    images = _synthetic_images(args.images)
+    cp.perform_ocr(images[0])  # warm-up: model load and first-inference allocations
+
+    def per_image():
+        # The pre-batching path: one engine call per image, fanned out over threads
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return list(executor.map(cp.perform_ocr, images))
+
+    rows, outputs = [], {}
+    for name, run in (("per-image", per_image), ("batched", lambda: cp.ocr_batch(images))):
+        times = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            outputs[name] = run()
+            times.append(time.perf_counter() - t)
+        rows.append([name, f"{min(times):.2f}", f"{len(images) / min(times):.1f}"])
+    base = float(rows[0][1])
+    for row in rows:
+        row.append(f"{base / float(row[1]):.2f}x")
+    same = sum(a == b for a, b in zip(outputs["per-image"], outputs["batched"]))
+
+    print(f"\nOCR: {len(images)} small images, {os.cpu_count()} CPU(s), best of {args.repeat}")
+    print_table(["mode", "seconds", "images/s", "speedup"], rows)
+    print(f"Identical text for {same}/{len(images)} images (recognition batches pad crops to a shared width).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="content_ingester benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("report", help="HTML report size and render cost: CDN vs offline")
+    p.add_argument("--sources", type=int, default=20)
+    p.add_argument("--chars", type=int, default=ci.Config.MAX_CHARS_DEFAULT)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--browser", action="store_true", help="Also measure load time in a headless browser (DrissionPage)")
+    p.add_argument("--timeout", type=float, default=30, help="Browser page-load timeout in seconds")
+    p.set_defaults(func=bench_report)
+
+    p = sub.add_parser("pdf", help="PDF text extraction: shared-reader threads vs page-range processes")
+    p.add_argument("--pages", type=int, default=2000, help="Pages in the synthetic PDF")
+    p.add_argument("--lines", type=int, default=50, help="Text lines per synthetic page")
+    p.add_argument("--file", help="Benchmark this PDF instead of a synthetic one")
+    p.add_argument("--processes", help="Comma-separated worker counts (default: 1, 2, 4, ... up to the CPU count)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser("ocr", help="OCR throughput: one engine call per image vs cross-image batched recognition")
+    p.add_argument("--images", type=int, default=120)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_ocr)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,33 @@ import re
 import zipfile
 import shutil
 import io
+import ast
+import html
+import bisect
+import json
+import base64
+import mmap
+import multiprocessing
+import codecs
+import collections
+import copy
+import contextlib
+import fnmatch
+import functools
+import hashlib
+import pathlib
+import queue
+import uuid
+import hmac
+import secrets
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import urllib.parse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Global tqdm and rich handle for safe access
 try:
@@ -32,6 +56,76 @@ except ImportError:
 # Platform Check
 IS_WINDOWS = sys.platform == 'win32'
 
+# ==========================================
+# DAEMON CLIENT (stdlib only: runs before the heavy imports below)
+# ==========================================
+def get_daemon_info_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "daemon.json")
+
+def run_via_daemon(argv):
+    """
+    Thin client: if an ingestion daemon is running (see IngestionDaemon), submits the job
+    to it and waits. Returns an exit code, or None to fall back to in-process execution.
+    """
+    if any(a in argv for a in ("--daemon", "--no-daemon", "--stop-daemon", "--show", "-h", "--help")):
+        return None
+    try:
+        with open(get_daemon_info_path(), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        base = f"http://127.0.0.1:{int(info['port'])}"
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    def call(method, path, body=None, timeout=5):
+        req = urllib.request.Request(base + path, method=method,
+                                     data=json.dumps(body).encode("utf-8") if body is not None else None,
+                                     headers={"X-Ingester-Token": info.get("token", ""), "Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    try:
+        call("GET", "/health", timeout=0.5)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        job = call("POST", "/jobs", {"argv": argv, "cwd": os.getcwd()})
+    except urllib.error.HTTPError as e:
+        print(f"[Ingester] Daemon rejected the job: {e.read().decode('utf-8', errors='replace')}")
+        return 2
+    except (OSError, ValueError):
+        return None
+    print(f"[Ingester] Submitted to daemon (pid {info.get('pid')}) as job {job['id']}")
+
+    status = None
+    while status not in ("done", "failed"):
+        time.sleep(0.3)
+        try:
+            job = call("GET", f"/jobs/{job['id']}")
+        except urllib.error.HTTPError as e:
+            # The daemon is up but no longer knows the job; re-running here would race its writes
+            print(f"[Ingester] Daemon lost job {job['id']} (HTTP {e.code}).")
+            return 1
+        except (OSError, ValueError) as e:
+            print(f"[Ingester] Lost connection to daemon ({e}). Running in-process instead.")
+            return None
+        if job["status"] != status:
+            status = job["status"]
+            print(f"[Ingester] Job {job['id']}: {status}")
+
+    if status == "failed":
+        print(f"[Ingester] Job failed: {job.get('error')}")
+        return 1
+    result = job["result"]
+    print(f"[Ingester] Processed {result['sources']} sources in {result['elapsed']:.1f}s "
+          f"({result['conflicts']} conflicts). All content saved to: {result['output_path']}")
+    return 0
+
+if __name__ == "__main__":
+    _exit_code = run_via_daemon(sys.argv[1:])
+    if _exit_code is not None:
+        sys.exit(_exit_code)
+
 # ==========================================
 # AUTO-DEPENDENCY INSTALLER
 # ==========================================
@@ -63,6 +157,7 @@ try:
     # OCR and Image support
     from rapidocr_onnxruntime import RapidOCR
     import cv2 
+    import numpy as np
     from PIL import Image
     
     # COM for .doc (Windows only)
@@ -82,6 +177,8 @@ import html2text
 import docx
 import pypdf
 from rapidocr_onnxruntime import RapidOCR
+import cv2
+import numpy as np
 # win32com handled above with IS_WINDOWS check
 
 # ==========================================
@@ -90,6 +187,7 @@ from rapidocr_onnxruntime import RapidOCR
 class Config:
     MAX_CHARS_DEFAULT = 50000
     TRUNCATION_MSG = "\n\n[SYSTEM: CONTENT TRUNCATED DUE TO LENGTH LIMIT]"
+    PARTIAL_MSG = "[SYSTEM: PARTIAL RESULT - {reason}]"
     
     @staticmethod
     def get_script_dir():
@@ -105,6 +203,23 @@ class Config:
     def get_browser_config_path():
         return os.path.join(Config.get_config_dir(), "browser_path.txt")
     
+    @staticmethod
+    def get_cache_dir(name):
+        path = os.path.join(Config.get_config_dir(), "cache", name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def load_dictionary(name, defaults):
+        """Terms from config/<name>.txt (one per line, # comments). Created from `defaults` if missing."""
+        path = os.path.join(Config.get_config_dir(), f"{name}.txt")
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# {name}: one term per line, matched case-insensitively. Add your own.\n")
+                f.write("\n".join(defaults) + "\n")
+        with open(path, "r", encoding="utf-8-sig") as f:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
     @staticmethod
     def get_output_path():
         return os.path.join(Config.get_config_dir(), "raw_content.txt")
@@ -180,10 +295,123 @@ def log_error(msg):
 def log_warning(msg):
     log(msg, "yellow")
 
+# ==========================================
+# DEADLINES & CANCELLATION
+# ==========================================
+CANCEL_GRACE = 5.0  # seconds a cancelled job gets to hand back its partial result
+
+class CancelToken:
+    """
+    Cooperative cancellation for one source (or, as `parent`, the whole run). The deadline clock
+    starts on start(); workers poll `cancelled` between pages, images and tiles and stop early.
+    """
+    def __init__(self, timeout=None, parent=None, name="source"):
+        self.timeout = timeout
+        self.parent = parent
+        self.name = name
+        self.deadline = None
+        self.reason = None
+
+    def start(self):
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        return self
+
+    def cancel(self, reason="cancelled"):
+        if self.reason is None:
+            self.reason = reason
+
+    @property
+    def cancelled(self):
+        if self.reason is None:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.reason = f"{self.name} deadline ({self.timeout:g}s) exceeded"
+            elif self.parent is not None and self.parent.cancelled:
+                self.reason = self.parent.reason
+        return self.reason is not None
+
+    def remaining(self, default=None):
+        """Seconds left before this token (or its parent) expires; `default` when unbounded."""
+        deadlines = [t.deadline for t in (self, self.parent) if t is not None and t.deadline is not None]
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else default
+
+class FetchStats:
+    """
+    Rolling sample of plain-HTTP fetch latencies, kept in config/fetch_latency.json so the
+    hedging threshold carries over between runs. percentile() is None until MIN_SAMPLES exist.
+    """
+    MAX_SAMPLES = 500
+    MIN_SAMPLES = 20
+
+    def __init__(self):
+        self.path = os.path.join(Config.get_config_dir(), "fetch_latency.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.samples = [float(x) for x in json.load(f)["samples"]][-self.MAX_SAMPLES:]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.samples = []
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(round(seconds, 3))
+            del self.samples[:-self.MAX_SAMPLES]
+
+    def percentile(self, pct):
+        with self.lock:
+            if len(self.samples) < self.MIN_SAMPLES: return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def save(self):
+        with self.lock:
+            data = {"samples": list(self.samples)}
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except OSError as e:
+            log_warning(f"Could not save fetch latency stats: {e}")
+
+def iter_completed(future_to_job, tokens, run_token, grace=CANCEL_GRACE):
+    """
+    as_completed() with deadlines. Yields (future, job, None) as jobs finish, and
+    (future, job, reason) for jobs still running `grace` seconds after their source's or the
+    run's deadline, so a stuck source cannot hold up the output.
+    """
+    pending = set(future_to_job)
+    while pending:
+        now = time.monotonic()
+        limits = {}
+        for future in pending:
+            token = tokens.get(future_to_job[future][0])
+            deadlines = [t.deadline for t in (token, run_token) if t is not None and t.deadline is not None]
+            limits[future] = min(deadlines) + grace if deadlines else None
+
+        for future, limit in limits.items():
+            if limit is not None and limit <= now:
+                pending.discard(future)
+                future.cancel()
+                token = tokens.get(future_to_job[future][0]) or run_token
+                reason = token.reason if token.cancelled else "deadline exceeded"
+                yield future, future_to_job[future], f"{reason}; no result within {grace:g}s grace"
+        if not pending:
+            break
+
+        bounded = [limit for future, limit in limits.items() if future in pending and limit is not None]
+        done, pending = wait(pending, timeout=max(0.0, min(bounded) - now) if bounded else None,
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future, future_to_job[future], None
+
 # ==========================================
 # BROWSER DRIVER
 # ==========================================
 class BrowserDriver:
+    # Daemon mode keeps one browser alive across fetches instead of launching Chromium per URL
+    keep_alive = False
+    _page = None
+    TIMEOUT = 45  # seconds per fetch: page load + settling
+
     @staticmethod
     def lazy_import_drission():
         try:
@@ -193,14 +421,21 @@ class BrowserDriver:
             return None, None
 
     @staticmethod
-    def fetch_html(url):
+    def fetch_html(url, timeout=None):
         log(f"Switching to DrissionPage for: {url}")
+        timeout = timeout or BrowserDriver.TIMEOUT
+        deadline = time.monotonic() + timeout
         ChromiumPage, ChromiumOptions = BrowserDriver.lazy_import_drission()
         if not ChromiumPage:
             return None, "[SYSTEM: DrissionPage not installed]"
 
         page = None
         try:
+            if BrowserDriver.keep_alive and BrowserDriver._page is not None:
+                page = BrowserDriver._page
+                page.get(url, timeout=timeout)
+                return BrowserDriver._settle(page, deadline), None
+
             co = ChromiumOptions()
             path = Config.get_browser_path()
             if path and os.path.exists(path):
@@ -213,56 +448,1215 @@ class BrowserDriver:
             co.set_user_agent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
             
             page = ChromiumPage(co)
-            page.get(url)
-            time.sleep(3)
-            
-            # [LCS-FIX] 2026-01-25: Multi-scroll to trigger CSDN/Zhihu lazy loading
-            for i in range(3):
-                log(f"Scrolling ({i+1}/3)...")
-                page.scroll.to_bottom()
-                time.sleep(2)
-            
-            # [LCS-FIX] Handling Zhihu/Generic Login Popups
-            try:
-                # Zhihu specific close button class
-                close_btn = page.ele('.Modal-closeButton', timeout=2)
-                if close_btn:
-                    log("Detected Zhihu Login Popup. Smashing it.")
-                    close_btn.click()
-                    time.sleep(1)
-            except Exception:
-                pass
-                
-            return page.html, None
+            if BrowserDriver.keep_alive:
+                BrowserDriver._page = page
+            page.get(url, timeout=max(1.0, deadline - time.monotonic()))
+            return BrowserDriver._settle(page, deadline), None
         except Exception as e:
             if page: 
                 try: page.quit()
                 except: pass
+            BrowserDriver._page = None
             return None, str(e)
 
+    @staticmethod
+    def _settle(page, deadline=None):
+        """Waits for lazy content, dismisses login popups and returns the page HTML (by `deadline`)."""
+        def left():
+            return float("inf") if deadline is None else deadline - time.monotonic()
+
+        time.sleep(max(0.0, min(3, left())))
+        
+        # [LCS-FIX] 2026-01-25: Multi-scroll to trigger CSDN/Zhihu lazy loading
+        for i in range(3):
+            if left() <= 0: break
+            log(f"Scrolling ({i+1}/3)...")
+            page.scroll.to_bottom()
+            time.sleep(max(0.0, min(2, left())))
+        
+        # [LCS-FIX] Handling Zhihu/Generic Login Popups
+        try:
+            # Zhihu specific close button class
+            close_btn = page.ele('.Modal-closeButton', timeout=max(0.1, min(2, left())))
+            if close_btn:
+                log("Detected Zhihu Login Popup. Smashing it.")
+                close_btn.click()
+                time.sleep(1)
+        except Exception:
+            pass
+            
+        return page.html
+
+    @staticmethod
+    def close():
+        if BrowserDriver._page is not None:
+            try: BrowserDriver._page.quit()
+            except: pass
+            BrowserDriver._page = None
+
+# ==========================================
+# LEGACY .DOC CONVERSION
+# ==========================================
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class DocConverter:
+    """
+    Converts .doc files to .docx, caching results by content hash (config/cache/doc/).
+    Backends: headless LibreOffice (any platform) first, Word COM on Windows as fallback.
+
+    LibreOffice runs in a small pool of slots, each with its own persistent user profile
+    (so parallel converters never fight over a profile lock and the first-run profile
+    setup is paid once). Requests arriving while slots are busy are batched into a single
+    soffice invocation, amortizing process start-up across files.
+    """
+    BATCH_SIZE = 8
+    TIMEOUT_PER_FILE = 120
+
+    def __init__(self, workers=None):
+        self.soffice = self.find_soffice()
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._slots = queue.Queue()
+        for slot in range(self.workers):
+            self._slots.put(slot)
+        self._pool = None
+
+    @staticmethod
+    def find_soffice():
+        for name in ("soffice", "libreoffice"):
+            path = shutil.which(name)
+            if path: return path
+        candidates = [
+            r"C:\Program Files\LibreOffice\program\soffice.exe",
+            r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+            "/Applications/LibreOffice.app/Contents/MacOS/soffice",
+            "/usr/lib/libreoffice/program/soffice",
+            "/opt/libreoffice/program/soffice",
+        ]
+        return next((p for p in candidates if os.path.exists(p)), None)
+
+    def convert(self, doc_path):
+        """Returns (docx_path, error). The docx lives in the cache; callers must not delete it."""
+        digest = file_sha256(doc_path)
+        cached = os.path.join(Config.get_cache_dir("doc"), f"{digest}.docx")
+        if os.path.exists(cached):
+            log(f"Using cached .docx conversion for {os.path.basename(doc_path)}")
+            return cached, None
+
+        err = "No .doc converter available. Install LibreOffice (soffice) or, on Windows, Microsoft Word."
+        if self.soffice:
+            docx_path, err = self._submit(doc_path, digest).result()
+            if docx_path: return docx_path, None
+        if IS_WINDOWS:
+            return self._convert_with_word(doc_path, cached)
+        return None, err
+
+    def _submit(self, doc_path, digest):
+        future = Future()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="doc-convert")
+            self._pending.append((doc_path, digest, future))
+        self._pool.submit(self._drain)
+        return future
+
+    def _drain(self):
+        slot = self._slots.get()
+        try:
+            with self._lock:
+                batch = self._pending[:self.BATCH_SIZE]
+                del self._pending[:self.BATCH_SIZE]
+            if batch:
+                self._run_batch(slot, batch)
+        finally:
+            self._slots.put(slot)
+
+    def _run_batch(self, slot, batch):
+        # Inputs are copied as <digest>.doc into a private dir: unique names, no collisions
+        work_dir = tempfile.mkdtemp(prefix="ka_doc_")
+        futures_by_digest = {}
+        try:
+            in_dir = os.path.join(work_dir, "in")
+            out_dir = os.path.join(work_dir, "out")
+            os.makedirs(in_dir)
+            os.makedirs(out_dir)
+            for doc_path, digest, future in batch:
+                if digest not in futures_by_digest:
+                    shutil.copyfile(doc_path, os.path.join(in_dir, f"{digest}.doc"))
+                futures_by_digest.setdefault(digest, []).append(future)
+
+            profile = pathlib.Path(Config.get_cache_dir(f"soffice_profile_{slot}")).resolve().as_uri()
+            cmd = [self.soffice, f"-env:UserInstallation={profile}", "--headless", "--norestore",
+                   "--nologo", "--nodefault", "--nolockcheck",
+                   "--convert-to", "docx:MS Word 2007 XML", "--outdir", out_dir]
+            cmd += [os.path.join(in_dir, f"{d}.doc") for d in futures_by_digest]
+            log(f"LibreOffice converting {len(futures_by_digest)} .doc file(s) (slot {slot})...")
+            proc = subprocess.run(cmd, capture_output=True, timeout=self.TIMEOUT_PER_FILE * len(futures_by_digest))
+
+            cache_dir = Config.get_cache_dir("doc")
+            for digest, futures in futures_by_digest.items():
+                out = os.path.join(out_dir, f"{digest}.docx")
+                if os.path.exists(out):
+                    cached = os.path.join(cache_dir, f"{digest}.docx")
+                    tmp = os.path.join(cache_dir, f"{digest}.{uuid.uuid4().hex}.tmp")
+                    shutil.move(out, tmp)
+                    os.replace(tmp, cached)
+                    result = (cached, None)
+                else:
+                    stderr = proc.stderr.decode(errors="replace").strip()[-300:]
+                    result = (None, f"LibreOffice conversion failed (exit {proc.returncode}): {stderr}")
+                for future in futures:
+                    future.set_result(result)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done(): future.set_result((None, str(e)))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _convert_with_word(self, doc_path, cached):
+        try:
+            import win32com.client
+            import pythoncom
+        except ImportError:
+            return None, "pywin32 not installed. Cannot process .doc files."
+
+        word = None
+        temp_docx = f"{cached}.{uuid.uuid4().hex}.tmp.docx"
+        try:
+            # Initialize COM
+            pythoncom.CoInitialize()
+            try:
+                word = win32com.client.Dispatch("Word.Application")
+            except Exception:
+                # Try dispatch ex if standard dispatch fails (sometimes helps)
+                word = win32com.client.DispatchEx("Word.Application")
+            
+            if not word: return None, "Failed to initialize Word Application"
+
+            word.Visible = False
+            word.DisplayAlerts = 0
+            
+            doc = word.Documents.Open(os.path.abspath(doc_path))
+            doc.SaveAs2(temp_docx, FileFormat=16) # 16 = wdFormatXMLDocument (docx)
+            doc.Close()
+            os.replace(temp_docx, cached)
+            return cached, None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            if word:
+                try: word.Quit()
+                except: pass
+
+# ==========================================
+# TEXT STREAMING & ENCODING DETECTION
+# ==========================================
+# ~500 most frequent Hanzi (simplified + traditional forms). Text decoded with the
+# right codec hits this set often; GBK bytes misread as Big5 (or vice versa) rarely do.
+_COMMON_HANZI = frozenset(
+    "的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间新什打便位因重被走电四第门相次东政海口使教西再平真听世气信北少关并内加化由却代军产入先山五太水万市眼体别处总才场师书比住员九笑性通目华报立马命张活难神数件安表原车白应路期叫死常提感金何更反合放做系计或司利受光王果亲界及今京务制解各任至清物台象记边共风战干接它许八特觉望直服毛林题建南度统色字请交爱让认算论百吃义科怎元社术结六功指思非流每青管夫连远资队跟带花快条院变联言权往展该领传近留红治决周保达办运武半候七必城父强步完革深区即求品士转量空甚众技轻程告江语英基派满式李息写呢识极令黄德收脸钱党倒未持取设始版双历越史商千片容研像找友孩站广改议形委早房音火际则首单据导影失拿网香似斯专石若兵弟谁校读志飞观争究包组造落视济喜离虽坐集编宝谈府拉黑且随格尽讲"
+    "這個國們來說為時會對學後麼與現點經實動兩長樣將發過還當開種無邊頭問愛讓認話門間東見車書裡機電體氣從進關題應師寫聽麼業從們數語樣幾處總場員報馬張難間線結萬華陽覺視聲義條輕識藝證類讀議論資種變運區"
+)
+
+_UTF16_BOMS = ((b'\xff\xfe\x00\x00', 'utf-32'), (b'\x00\x00\xfe\xff', 'utf-32'),
+               (b'\xef\xbb\xbf', 'utf-8-sig'), (b'\xff\xfe', 'utf-16'), (b'\xfe\xff', 'utf-16'))
+
+def _decodes_strictly(data, encoding, final):
+    """Decodes a (possibly truncated) prefix. Returns the text or None on invalid bytes."""
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="strict").decode(data, final=final)
+    except UnicodeDecodeError:
+        return None
+
+def _hanzi_score(text):
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    if not non_ascii: return 0.0
+    return sum(1 for c in text if c in _COMMON_HANZI) / non_ascii
+
+def detect_encoding(prefix, final=False):
+    """
+    Sniffs the encoding of a bounded byte prefix.
+    Order: BOM -> BOM-less UTF-16 -> UTF-8 validity -> GB18030/Big5 heuristic -> cp1252/latin-1.
+    Returns None if the data looks binary.
+    """
+    for bom, enc in _UTF16_BOMS:
+        if prefix.startswith(bom): return enc
+
+    if prefix:
+        # BOM-less UTF-16: ASCII-range text has a NUL in every other byte
+        even_nuls = prefix[0::2].count(0) / max(1, len(prefix[0::2]))
+        odd_nuls = prefix[1::2].count(0) / max(1, len(prefix[1::2]))
+        if odd_nuls > 0.4 and even_nuls < 0.05: return 'utf-16-le'
+        if even_nuls > 0.4 and odd_nuls < 0.05: return 'utf-16-be'
+        if b'\x00' in prefix: return None
+
+    if _decodes_strictly(prefix, 'utf-8', final) is not None:
+        return 'utf-8'
+
+    best, best_score = None, 0.15  # below this ratio CJK decoding is most likely accidental
+    for enc in ('gb18030', 'big5'):
+        text = _decodes_strictly(prefix, enc, final)
+        if text is None: continue
+        score = _hanzi_score(text)
+        if score > best_score:
+            best, best_score = enc, score
+    if best: return best
+
+    return 'cp1252' if _decodes_strictly(prefix, 'cp1252', final) is not None else 'latin-1'
+
+class TextStream:
+    """
+    A text source decoded incrementally from a binary opener.
+    Memory use is bounded by CHUNK_SIZE (and the preview), independent of file size.
+    """
+    CHUNK_SIZE = 1 << 20
+    SNIFF_BYTES = 64 * 1024
+
+    def __init__(self, opener, meta=""):
+        self.opener = opener  # callable -> binary file object
+        self.meta = meta
+        self.encoding = None
+        self._preview = None
+
+    @classmethod
+    def from_path(cls, path, meta=""):
+        return cls(lambda: open(path, "rb"), meta)
+
+    def sniff(self):
+        """Detects the encoding from a bounded prefix. Returns None for binary data."""
+        with self.opener() as f:
+            prefix = f.read(self.SNIFF_BYTES)
+            final = not f.read(1)
+        self.encoding = detect_encoding(prefix, final=final)
+        return self.encoding
+
+    def iter_text(self):
+        """Yields decoded text chunks (newlines normalized), without the header."""
+        if not self.encoding: self.sniff()
+        decoder = codecs.getincrementaldecoder(self.encoding or 'latin-1')(errors="replace")
+        pending_cr = ""
+        with self.opener() as f:
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                text = pending_cr + decoder.decode(data, final=not data)
+                # Hold back a trailing \r so a \r\n split across chunks still collapses
+                pending_cr = "\r" if data and text.endswith("\r") else ""
+                if pending_cr: text = text[:-1]
+                if text: yield text.replace("\r\n", "\n").replace("\r", "\n")
+                if not data: break
+
+    def iter_chunks(self):
+        """Yields the full source (header + content) chunk by chunk, for the output writer."""
+        yield f"{self.meta}\n=== CONTENT ===\n"
+        yield from self.iter_text()
+
+    def preview(self, limit=Config.MAX_CHARS_DEFAULT):
+        """Bounded text view (header + first `limit` chars) for in-memory downstream stages."""
+        if self._preview is None:
+            parts, size, truncated = [], 0, False
+            for chunk in self.iter_text():
+                parts.append(chunk[:limit - size])
+                size += len(parts[-1])
+                if size >= limit:
+                    truncated = True
+                    break
+            body = "".join(parts) + (Config.TRUNCATION_MSG if truncated else "")
+            self._preview = f"{self.meta}\n=== CONTENT ===\n{body}"
+        return self._preview
+
+def as_text(result):
+    """Returns an in-memory text view of a source result (str, SourceDoc, TextStream or ContainerResult)."""
+    return result if isinstance(result, str) else result.preview()
+
+def write_result(f, result):
+    """Writes a source result to an open text file, streaming non-str results chunk by chunk."""
+    if isinstance(result, str):
+        f.write(result)
+    else:
+        for chunk in result.iter_chunks():
+            f.write(chunk)
+
+# ==========================================
+# DIRECTORY & ZIP INPUTS
+# ==========================================
+CONTAINER_EXTS = ('.zip',)
+DEFAULT_EXCLUDES = [".git", ".svn", ".hg", "__pycache__", "node_modules", ".venv", "venv", ".idea", ".vscode", "*.pyc", ".DS_Store"]
+
+def is_container(path):
+    return os.path.isdir(path) or (os.path.isfile(path) and path.lower().endswith(CONTAINER_EXTS))
+
+def _glob_match(rel_path, patterns):
+    """fnmatch against the relative path, its basename and every parent directory."""
+    parts = rel_path.split("/")
+    candidates = [rel_path] + ["/".join(parts[:i]) for i in range(1, len(parts))] + parts
+    return any(fnmatch.fnmatch(c, pat) for pat in patterns for c in candidates)
+
+class SourceMember:
+    """One file inside a directory or .zip input. Opened lazily via `opener`."""
+    __slots__ = ("container", "name", "label", "ext", "opener", "path")
+
+    def __init__(self, container, name, opener, path=None):
+        self.container = container
+        self.name = name
+        self.label = f"{os.path.basename(os.path.normpath(container))}/{name}"
+        self.ext = os.path.splitext(name)[1].lower()
+        self.opener = opener
+        self.path = path
+
+def _zip_member_opener(zf, info):
+    @contextlib.contextmanager
+    def opener():
+        # One ZipFile per archive: member handles from it read independently (and thread-safely),
+        # and the central directory is parsed once instead of on every open
+        with zf.open(info) as f:
+            yield f
+    return opener
+
+def _zip_display_name(info):
+    # Archives made on Chinese Windows store GBK names without the UTF-8 flag
+    if info.flag_bits & 0x800: return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+def iter_container_members(path, include=None, exclude=None):
+    """
+    Lazily yields SourceMember objects for a directory or .zip archive, in sorted order.
+    Zip members are read straight from the archive; nothing is extracted to disk.
+    """
+    include = include or ["*"]
+    exclude = DEFAULT_EXCLUDES + (exclude or [])
+
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            rel_root = os.path.relpath(root, path).replace(os.sep, "/")
+            rel_root = "" if rel_root == "." else rel_root + "/"
+            dirs[:] = sorted(d for d in dirs if not _glob_match(rel_root + d, exclude))
+            for name in sorted(files):
+                rel = rel_root + name
+                if _glob_match(rel, exclude) or not _glob_match(rel, include): continue
+                full = os.path.join(root, name)
+                yield SourceMember(path, rel, functools.partial(open, full, "rb"), path=full)
+        return
+
+    # Not closed here: members are opened long after the walk; the handle closes with the last opener
+    zf = zipfile.ZipFile(path)
+    infos = sorted((i for i in zf.infolist() if not i.is_dir()), key=_zip_display_name)
+    for info in infos:
+        rel = _zip_display_name(info)
+        if _glob_match(rel, exclude) or not _glob_match(rel, include): continue
+        yield SourceMember(path, rel, _zip_member_opener(zf, info))
+
+class ContainerResult:
+    """Per-member results of a directory/.zip input, kept in walk order."""
+
+    def __init__(self, path):
+        kind = "Directory" if os.path.isdir(path) else "ZIP Archive"
+        self.meta = f"Title: {os.path.basename(os.path.normpath(path))}\nSource: {kind}\nDate: {time.strftime('%Y-%m-%d')}\n"
+        self.members = []  # [label, result]; result is filled in as member jobs complete
+        self.partial = None  # reason, when the walk stopped early
+
+    def add(self, label):
+        self.members.append([label, None])
+        return len(self.members) - 1
+
+    def iter_chunks(self):
+        yield f"{self.meta}Members: {len(self.members)}\n\n=== CONTENT ===\n"
+        for k, (label, result) in enumerate(self.members):
+            yield f"\n\n--- MEMBER {k+1}: {label} ---\n\n"
+            if isinstance(result, str):
+                yield result
+            else:
+                yield from result.iter_chunks()
+        if self.partial:
+            yield f"\n\n{Config.PARTIAL_MSG.format(reason=self.partial)}\n"
+
+    def preview(self, limit=Config.MAX_CHARS_DEFAULT):
+        parts, size = [], 0
+        for chunk in self.iter_chunks():
+            parts.append(chunk[:limit - size])
+            size += len(parts[-1])
+            if size >= limit:
+                parts.append(Config.TRUNCATION_MSG)
+                break
+        return "".join(parts)
+
+# ==========================================
+# STRUCTURED OUTPUT (JSONL + OFFSET INDEX)
+# ==========================================
+class Segment:
+    """
+    One structured piece of a source: a PDF page's text layer, an OCR'd image or a text section.
+    `rendered` is its exact raw_content.txt form (markers included); `text` is the bare content.
+    """
+    __slots__ = ("kind", "text", "rendered", "origin", "page", "image")
+
+    def __init__(self, kind, text, rendered=None, origin="text", page=None, image=None):
+        self.kind = kind  # page | image | section | error | partial
+        self.text = text
+        self.rendered = text if rendered is None else rendered
+        self.origin = origin  # text | ocr | html | code
+        self.page = page
+        self.image = image
+
+class SourceDoc:
+    """An extracted source kept as ordered Segments. The flat text view is rendered from them."""
+
+    def __init__(self, meta, segments):
+        self.meta = meta
+        self.segments = segments
+
+    def iter_chunks(self):
+        yield f"{self.meta}\n=== CONTENT ===\n"
+        for seg in self.segments:
+            yield seg.rendered
+
+    def preview(self, limit=None):
+        # Already in memory, so (like plain-string results) the full text is returned
+        return "".join(self.iter_chunks())
+
+def partial_segment(reason, detail, page=None):
+    """Marker for work skipped after cancellation; rendered in place in raw_content.txt."""
+    msg = Config.PARTIAL_MSG.format(reason=f"{reason}; {detail}")
+    return Segment("partial", msg, f"\n\n{msg}\n", page=page)
+
+def markdown_sections(markdown, origin="text"):
+    """Splits Markdown into one Segment per heading-led section (lossless: the pieces join back)."""
+    return [Segment("section", part, origin=origin) for part in re.split(r'(?m)^(?=#{1,6} )', markdown) if part]
+
+def _meta_fields(meta):
+    """Parses a source header ("Title: ...\nAuthor: ...") into a dict."""
+    fields = {}
+    for line in meta.splitlines():
+        m = re.match(r'^([A-Za-z]+): (.*)$', line)
+        if m: fields[m.group(1).lower()] = m.group(2).strip()
+    return fields
+
+def _record(kind, text, title, member=None, origin="text", page=None, image=None, **extra):
+    return {"kind": kind, "member": member, "title": title, "page": page, "image": image,
+            "origin": origin, "chars": len(text), "text": text, **extra}
+
+def iter_records(result, member=None):
+    """
+    Yields structured records for one source result (str, SourceDoc, TextStream or
+    ContainerResult): a header record with the parsed metadata, then one record per
+    page / image / section. Text streams are emitted chunk by chunk, never joined.
+    """
+    if result is None or isinstance(result, str):
+        text = result or "Error: Content missing"
+        for marker, kind in (("\n=== CONTENT ===\n", "section"), ("\n=== ERROR ===\n", "error")):
+            meta, sep, body = text.partition(marker)
+            if sep:
+                fields = _meta_fields(meta)
+                yield _record("header", "", fields.get("title"), member, meta=fields)
+                yield _record(kind, body, fields.get("title"), member)
+                return
+        yield _record("error", text, None, member)
+        return
+
+    fields = _meta_fields(result.meta)
+    title = fields.get("title")
+    if isinstance(result, TextStream):
+        fields["encoding"] = result.encoding
+    yield _record("header", "", title, member, meta=fields)
+
+    if isinstance(result, SourceDoc):
+        for seg in result.segments:
+            yield _record(seg.kind, seg.text, title, member, seg.origin, seg.page, seg.image)
+    elif isinstance(result, TextStream):
+        for chunk in result.iter_text():
+            yield _record("section", chunk, title, member)
+    elif isinstance(result, ContainerResult):
+        for label, member_result in result.members:
+            yield from iter_records(member_result, member=label)
+        if result.partial:
+            yield _record("partial", Config.PARTIAL_MSG.format(reason=result.partial), title)
+
+class StructuredWriter:
+    """
+    Writes raw_content.jsonl (one JSON record per line) and raw_content.idx.json, a columnar
+    index with the byte offset and length of every record, so consumers can mmap the JSONL
+    and jump straight to a source or page (see StructuredReader).
+    """
+    INDEX_COLUMNS = ["source", "member", "page", "kind", "offset", "length"]
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + ".idx.json"
+        self.rows = []
+        self.members = {}  # label -> index into the index's "members" list
+        self.offset = 0
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "wb")
+        return self
+
+    def write(self, source, url, record):
+        record = {"source": source, "url": url, **record}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        member = record.get("member")
+        if member is not None:
+            member = self.members.setdefault(member, len(self.members))
+        self.rows.append([source, member, record.get("page"), record["kind"], self.offset, len(line)])
+        self.f.write(line)
+        self.offset += len(line)
+
+    def write_source(self, source, url, result):
+        for record in iter_records(result):
+            self.write(source, url, record)
+
+    def __exit__(self, *exc):
+        self.f.close()
+        index = {"version": 1, "data": os.path.basename(self.path), "columns": self.INDEX_COLUMNS,
+                 "members": list(self.members), "rows": self.rows}
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        return False
+
+class StructuredReader:
+    """
+    Random access to a raw_content.jsonl through its offset index. The JSONL is memory-mapped;
+    only the selected records are decoded.
+
+        with StructuredReader("config/raw_content.jsonl") as r:
+            for rec in r.records(source=2, page=14):
+                print(rec["text"])
+    """
+
+    def __init__(self, path):
+        with open(os.path.splitext(path)[0] + ".idx.json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.members = index["members"]
+        self.rows = index["rows"]
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap): self._mm.close()
+        self._file.close()
+
+    def sources(self):
+        return sorted({row[0] for row in self.rows if row[0] is not None})
+
+    def records(self, source=None, page=None, member=None, kind=None):
+        """Yields the records matching every given filter (member is a label), in file order."""
+        member_idx = self.members.index(member) if member in self.members else -1
+        for src, mem, pg, knd, offset, length in self.rows:
+            if source is not None and src != source: continue
+            if page is not None and pg != page: continue
+            if member is not None and mem != member_idx: continue
+            if kind is not None and knd != kind: continue
+            yield json.loads(self._mm[offset:offset + length])
+
+# ==========================================
+# CODE REPOSITORY INGESTION
+# ==========================================
+CODE_LANGS = {
+    '.py': 'python', '.pyw': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript', '.vue': 'javascript',
+    '.java': 'java', '.cs': 'java', '.scala': 'java',
+    '.go': 'go', '.rs': 'rust',
+    '.c': 'c', '.h': 'c', '.cc': 'c', '.cpp': 'c', '.cxx': 'c', '.hpp': 'c', '.hh': 'c',
+}
+CODE_PARSE_VERSION = 1
+CODE_MAX_FILE_BYTES = 2 * 1024 * 1024  # larger files are usually generated/minified
+CODE_MAX_EDGES = 2000
+
+_CODE_KEYWORDS = frozenset("if for while switch catch return function else do sizeof typeof new delete case await yield with elif not and or in is lambda def class fn match loop unsafe defer go select".split())
+
+# (kind, regex) per language; group 1 is the symbol name. Applied to comment/string-stripped text.
+_CODE_DEF_PATTERNS = {
+    'javascript': [
+        ('class', r'\bclass\s+([A-Za-z_$][\w$]*)'),
+        ('function', r'\bfunction\s*\*?\s*([A-Za-z_$][\w$]*)\s*\('),
+        ('function', r'\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s*)?(?:function\b|\([^()]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)'),
+        ('method', r'^[ \t]+(?:(?:public|private|protected|static|async|get|set|override|readonly)\s+)*([A-Za-z_$][\w$]*)\s*\([^()]*\)\s*(?::\s*[^{;]+)?\{'),
+    ],
+    'java': [
+        ('class', r'\b(?:class|interface|enum|record|struct|object|trait)\s+([A-Za-z_]\w*)'),
+        ('method', r'^[ \t]*(?:[\w<>\[\],.?@]+[ \t]+)+([A-Za-z_]\w*)\s*\([^;{}]*\)\s*(?:throws\s+[\w., ]+)?\s*\{'),
+    ],
+    'go': [
+        ('class', r'^type\s+([A-Za-z_]\w*)\s+(?:struct|interface)\b'),
+        ('function', r'^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)\s*\('),
+    ],
+    'rust': [
+        ('class', r'\b(?:struct|enum|trait)\s+([A-Za-z_]\w*)'),
+        ('class', r'^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>]+\s+for\s+)?([A-Za-z_]\w*)'),
+        ('function', r'\bfn\s+([A-Za-z_]\w*)'),
+    ],
+    'c': [
+        ('class', r'\b(?:class|struct|namespace)\s+([A-Za-z_]\w*)\s*(?::[^{;]*)?\{'),
+        ('function', r'^[ \t]*[A-Za-z_][\w \t\*&:<>,]*?[\s\*&]([A-Za-z_~][\w:~]*)\s*\([^;{}]*\)\s*(?:const\s*)?(?:noexcept\s*)?\{'),
+    ],
+}
+
+_CODE_IMPORT_PATTERNS = {
+    'javascript': [r'^\s*import\s+(?:[^\'"]*?\s+from\s+)?[\'"]([^\'"]+)[\'"]', r'\brequire\(\s*[\'"]([^\'"]+)[\'"]\s*\)'],
+    'java': [r'^\s*import\s+(?:static\s+)?([\w.*]+)\s*;', r'^\s*using\s+([\w.]+)\s*;'],
+    'go': [r'^\s*import\s+(?:\w+\s+)?"([^"]+)"', r'^\s+(?:\w+\s+)?"([^"]+)"\s*$'],
+    'rust': [r'^\s*(?:pub\s+)?use\s+([\w:{}, *]+);', r'^\s*extern\s+crate\s+(\w+)'],
+    'c': [r'^\s*#\s*include\s*[<"]([^>"]+)[>"]'],
+}
+
+_CODE_STRIP_RE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`', re.S)
+_CODE_CALL_RE = re.compile(r'\b([A-Za-z_$][\w$]*)\s*\(')
+
+def _blank_out(match):
+    # Keep newlines so offsets and line numbers stay valid
+    return re.sub(r'[^\n]', ' ', match.group(0))
+
+def _python_calls(node):
+    """Names called inside a function body, not descending into nested defs/classes."""
+    calls = set()
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(child, ast.Call):
+            func = child.func
+            if isinstance(func, ast.Name): calls.add(func.id)
+            elif isinstance(func, ast.Attribute): calls.add(func.attr)
+        stack.extend(ast.iter_child_nodes(child))
+    return sorted(calls)
+
+def _parse_python_source(text):
+    tree = ast.parse(text)
+    imports, symbols = [], []
+
+    def visit(node, prefix, in_class):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.Import):
+                imports.extend(a.name for a in child.names)
+            elif isinstance(child, ast.ImportFrom):
+                imports.append("." * child.level + (child.module or ""))
+            elif isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                start = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                qualname = prefix + child.name
+                if isinstance(child, ast.ClassDef):
+                    bases = ", ".join(ast.unparse(b) for b in child.bases)
+                    symbols.append({"kind": "class", "name": child.name, "qualname": qualname, "start": start,
+                                    "end": child.end_lineno, "signature": f"class {child.name}({bases})" if bases else f"class {child.name}",
+                                    "calls": []})
+                    visit(child, qualname + ".", True)
+                else:
+                    prefix_kw = "async def" if isinstance(child, ast.AsyncFunctionDef) else "def"
+                    returns = f" -> {ast.unparse(child.returns)}" if child.returns else ""
+                    symbols.append({"kind": "method" if in_class else "function", "name": child.name, "qualname": qualname,
+                                    "start": start, "end": child.end_lineno,
+                                    "signature": f"{prefix_kw} {child.name}({ast.unparse(child.args)}){returns}",
+                                    "calls": _python_calls(child)})
+                    visit(child, qualname + ".", False)
+            else:
+                visit(child, prefix, in_class)
+
+    visit(tree, "", False)
+    return imports, symbols
+
+def _parse_generic_source(text, lang):
+    """Lightweight tokenizing parser: strips comments/strings, then matches definitions and braces."""
+    clean = _CODE_STRIP_RE.sub(_blank_out, text)
+    line_starts = [0] + [m.end() for m in re.finditer(r'\n', clean)]
+    line_of = lambda pos: bisect.bisect_right(line_starts, pos)
+
+    imports = []
+    for pat in _CODE_IMPORT_PATTERNS.get(lang, []):
+        imports.extend(m.group(1).strip() for m in re.finditer(pat, text, re.M))
+
+    found = {}
+    for kind, pat in _CODE_DEF_PATTERNS.get(lang, []):
+        for m in re.finditer(pat, clean, re.M):
+            name = m.group(1)
+            if name in _CODE_KEYWORDS or m.start(1) in found: continue
+            # Body: first '{' after the name, unless a ';' ends the declaration first
+            brace = clean.find("{", m.start(1))
+            semi = clean.find(";", m.start(1))
+            end_pos = m.end()
+            if brace != -1 and (semi == -1 or brace < semi):
+                depth = 0
+                for pos in range(brace, len(clean)):
+                    ch = clean[pos]
+                    if ch == "{": depth += 1
+                    elif ch == "}":
+                        depth -= 1
+                        if depth == 0:
+                            end_pos = pos
+                            break
+                else:
+                    end_pos = len(clean) - 1
+            found[m.start(1)] = (kind, name, m.start(), end_pos, brace)
+
+    symbols = []
+    ranges = sorted(found.values(), key=lambda s: s[2])
+    for kind, name, start_pos, end_pos, brace in ranges:
+        start_line = line_of(start_pos)
+        # Qualify by the innermost enclosing class-like symbol
+        owner = None
+        for o_kind, o_name, o_start, o_end, _ in ranges:
+            if o_kind == 'class' and o_start < start_pos and end_pos <= o_end:
+                owner = o_name
+        if owner and kind == 'function': kind = 'method'
+        body = clean[brace:end_pos] if brace != -1 and brace < end_pos else ""
+        calls = sorted({c for c in _CODE_CALL_RE.findall(body) if c not in _CODE_KEYWORDS and c != name})
+        signature = " ".join(text[start_pos:brace if brace != -1 and brace < end_pos else end_pos + 1].split())[:200]
+        symbols.append({"kind": kind, "name": name, "qualname": f"{owner}.{name}" if owner else name,
+                        "start": start_line, "end": line_of(end_pos), "signature": signature,
+                        "calls": calls if kind != 'class' else []})
+    return imports, symbols
+
+def parse_code_source(text, lang):
+    """Parses one source file into a JSON-serializable outline. Module-level so process pools can pickle it."""
+    result = {"v": CODE_PARSE_VERSION, "lang": lang, "lines": text.count("\n") + 1}
+    try:
+        if lang == 'python':
+            result["imports"], result["symbols"] = _parse_python_source(text)
+        else:
+            result["imports"], result["symbols"] = _parse_generic_source(text, lang)
+    except (SyntaxError, ValueError, RecursionError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["imports"], result["symbols"] = [], []
+    return result
+
+class CodeIndexer:
+    """
+    Builds a compact outline of a source tree: modules, classes, functions, imports and
+    call edges, plus the most-referenced function bodies that fit in a character budget.
+    Per-file parse results are cached by content hash and language (config/cache/code/), so
+    re-indexing a large repo after a small change only re-parses the changed files.
+    Files not yet read or parsed when `cancel` fires are left out and counted in `unindexed`.
+    """
+    PROCESS_POOL_MIN_FILES = 16
+
+    def __init__(self, budget=None, cancel=None, get_pool=None, discard_pool=None):
+        self.budget = budget or Config.MAX_CHARS_DEFAULT
+        self.cache_dir = Config.get_cache_dir("code")
+        self.cancel = cancel or CancelToken()
+        self.get_pool = get_pool  # returns a shared process pool for big parse batches (see ContentParser)
+        self.discard_pool = discard_pool  # called with that pool if a worker crashed
+        self.unindexed = 0
+
+    def _cache_path(self, digest, lang):
+        return os.path.join(self.cache_dir, f"{digest}.{lang}.v{CODE_PARSE_VERSION}.json")
+
+    def _load(self, member):
+        """Returns (member, text, digest, cached outline or None); None if too large, False if
+        cancelled, or an error string if the file cannot be read."""
+        if self.cancel.cancelled:
+            return False
+        try:
+            with member.opener() as f:
+                data = f.read(CODE_MAX_FILE_BYTES + 1)
+        except Exception as e:  # dangling symlink, permissions, corrupt archive member
+            return f"{member.name}: {e}"
+        if len(data) > CODE_MAX_FILE_BYTES:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        text = data.decode(detect_encoding(data[:TextStream.SNIFF_BYTES], final=True) or 'latin-1', errors="replace")
+        parsed = None
+        cache_path = self._cache_path(digest, CODE_LANGS[member.ext])
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                parsed = json.load(f)
+            if parsed.get("v") != CODE_PARSE_VERSION: parsed = None
+        except (OSError, ValueError):
+            pass
+        return member, text.replace("\r\n", "\n"), digest, parsed
+
+    def _save(self, digest, parsed):
+        tmp = os.path.join(self.cache_dir, f"{digest}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(parsed, f, ensure_ascii=False)
+            os.replace(tmp, self._cache_path(digest, parsed["lang"]))
+        except OSError:
+            pass
+
+    def index(self, members):
+        started = time.time()
+        members = [m for m in members if m.ext in CODE_LANGS]
+
+        # 1. Read + hash + cache lookup (I/O bound: threads)
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4)) as executor:
+            loaded = list(executor.map(self._load, members))
+        skipped = sum(x is None for x in loaded)
+        self.unindexed = sum(x is False for x in loaded)
+        unreadable = [x for x in loaded if isinstance(x, str)]
+        for err in unreadable:
+            log_warning(f"Unreadable code file skipped: {err}")
+        loaded = [x for x in loaded if isinstance(x, tuple)]
+
+        # 2. Parse cache misses (CPU bound: processes for big batches)
+        misses = [i for i, (_, _, _, parsed) in enumerate(loaded) if parsed is None]
+        texts = [loaded[i][1] for i in misses]
+        langs = [CODE_LANGS[loaded[i][0].ext] for i in misses]
+        results = None
+        if self.get_pool and len(misses) >= self.PROCESS_POOL_MIN_FILES and (os.cpu_count() or 1) > 1:
+            pool = None
+            try:
+                pool = self.get_pool()
+                results = []
+                # Leaving the map early cancels its queued chunks; the shared pool stays up
+                for parsed in pool.map(parse_code_source, texts, langs, chunksize=8):
+                    if self.cancel.cancelled: break
+                    results.append(parsed)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool) and self.discard_pool: self.discard_pool(pool)
+                log_warning(f"Process pool unavailable ({e}); parsing in-process.")
+                results = None
+        if results is None:
+            results = []
+            for t, l in zip(texts, langs):
+                if self.cancel.cancelled: break
+                results.append(parse_code_source(t, l))
+        for i, parsed in zip(misses, results):
+            member, text, digest, _ = loaded[i]
+            loaded[i] = (member, text, digest, parsed)
+            self._save(digest, parsed)
+        if len(results) < len(misses):
+            unparsed = set(misses[len(results):])
+            self.unindexed += len(unparsed)
+            loaded = [x for i, x in enumerate(loaded) if i not in unparsed]
+            misses = misses[:len(results)]
+
+        log(f"Code index: {len(loaded)} files ({len(loaded) - len(misses)} cached, {len(misses)} parsed) in {time.time() - started:.2f}s")
+        return self._render(loaded, len(misses), skipped, len(unreadable))
+
+    def _render(self, loaded, parsed_count, skipped, unreadable=0):
+        # Resolve call names to symbols defined in the repo
+        defined = {}
+        for member, _, _, parsed in loaded:
+            for sym in parsed["symbols"]:
+                if sym["kind"] != "class":
+                    defined.setdefault(sym["name"], []).append((member.name, sym["qualname"]))
+
+        in_degree = {}
+        edges = []
+        for member, _, _, parsed in loaded:
+            for sym in parsed["symbols"]:
+                for call in sym["calls"]:
+                    targets = defined.get(call, [])
+                    # Same-file definitions win; otherwise only names defined in a few places resolve
+                    local = [t for t in targets if t[0] == member.name]
+                    targets = local or (targets if len(targets) <= 3 else [])
+                    for target in targets:
+                        edges.append(f"{member.name}:{sym['qualname']} -> {target[0]}:{target[1]}")
+                        in_degree[target] = in_degree.get(target, 0) + 1
+
+        n_symbols = sum(len(p["symbols"]) for _, _, _, p in loaded)
+        out = [f"Files: {len(loaded)} (cached: {len(loaded) - parsed_count}, parsed: {parsed_count}"
+               f"{f', skipped >2MB: {skipped}' if skipped else ''}{f', unreadable: {unreadable}' if unreadable else ''}) | Symbols: {n_symbols} | Call edges: {len(edges)}",
+               "", "=== CODE OUTLINE ==="]
+        for member, _, _, parsed in loaded:
+            out.append(f"\n## {member.name} ({parsed['lang']}, {parsed['lines']} lines)")
+            if parsed.get("error"): out.append(f"[PARSE ERROR] {parsed['error']}")
+            if parsed["imports"]: out.append("imports: " + ", ".join(dict.fromkeys(parsed["imports"])))
+            for sym in parsed["symbols"]:
+                indent = "  " * sym["qualname"].count(".")
+                calls = [c for c in sym["calls"] if c in defined]
+                out.append(f"{indent}{sym['signature']}  [L{sym['start']}-{sym['end']}]" + (f"  -> {', '.join(calls)}" if calls else ""))
+
+        out += ["", "=== CALL GRAPH ==="] + (edges[:CODE_MAX_EDGES] or ["(no resolved call edges)"])
+        if len(edges) > CODE_MAX_EDGES:
+            out.append(f"... {len(edges) - CODE_MAX_EDGES} more edges omitted")
+
+        # Bodies: most-referenced first, then smallest; each capped to keep the budget spread out
+        candidates = []
+        for member, text, _, parsed in loaded:
+            lines = text.split("\n")
+            for sym in parsed["symbols"]:
+                if sym["kind"] == "class": continue
+                body = "\n".join(lines[sym["start"] - 1:sym["end"]])
+                candidates.append((-in_degree.get((member.name, sym["qualname"]), 0), len(body), member.name, sym, body, parsed["lang"]))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+
+        budget, chosen = self.budget, []
+        per_body_cap = max(2000, self.budget // 8)
+        for c in candidates:
+            if c[1] > per_body_cap or c[1] > budget: continue
+            chosen.append(c)
+            budget -= c[1]
+        chosen.sort(key=lambda c: (c[2], c[3]["start"]))
+
+        out += ["", f"=== SELECTED BODIES ({len(chosen)}/{len(candidates)}, budget {self.budget} chars) ==="]
+        for _, _, name, sym, body, lang in chosen:
+            out.append(f"\n### {name}:{sym['qualname']} [L{sym['start']}-{sym['end']}]\n```{lang}\n{body}\n```")
+        return "\n".join(out)
+
+# ==========================================
+# DOCX XML HELPERS
+# ==========================================
+DOCX_OCR_IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+DOCX_TAG_P = f"{{{_W_NS}}}p"
+DOCX_TAG_TBL = f"{{{_W_NS}}}tbl"
+DOCX_TAG_T = f"{{{_W_NS}}}t"
+DOCX_TAG_TAB = f"{{{_W_NS}}}tab"
+DOCX_TAG_BR = f"{{{_W_NS}}}br"
+DOCX_TAG_CR = f"{{{_W_NS}}}cr"
+DOCX_TAG_BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+DOCX_TAG_IMAGEDATA = "{urn:schemas-microsoft-com:vml}imagedata"
+DOCX_TAG_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+DOCX_ATTR_EMBED = f"{{{_R_NS}}}embed"
+DOCX_ATTR_ID = f"{{{_R_NS}}}id"
+
+class DocxImageRef:
+    """Placeholder for an image occurrence in the DOCX body (document order)"""
+    __slots__ = ("index", "r_id")
+
+    def __init__(self, index, r_id):
+        self.index = index
+        self.r_id = r_id
+
+# ==========================================
+# LARGE IMAGE PREPROCESSING (LONG SCREENSHOTS / HIGH-RES PHOTOS)
+# ==========================================
+class ImageTiler:
+    """
+    Plans OCR for oversized images: downscale to an effective text resolution, then cut
+    into overlapping strips/tiles small enough that the detector does not resize them
+    (RapidOCR shrinks inputs to `max_side_len`, ~2000px, on the long side, which erases small text).
+    """
+    MAX_SHORT_SIDE = 2480   # ~A4 width at 300 DPI; more pixels only cost time
+    TILE_SIZE = 1600
+    OVERLAP = 160           # taller than a text line, so every line is whole in some tile
+    DETECTOR_MAX_SIDE = 2000
+
+    def __init__(self, max_side=None):
+        # No tile side may exceed the detector's own resize limit
+        self.max_side = max_side or self.DETECTOR_MAX_SIDE
+        self.tile_size = min(self.TILE_SIZE, int(self.max_side * 0.8))
+        self.span_limit = min(int(self.tile_size * 1.25), self.max_side)
+
+    @staticmethod
+    def load(src):
+        """
+        Decodes a path or bytes into a BGR ndarray (np.fromfile handles non-ASCII paths).
+        Transparency is flattened onto white: formula/diagram PNGs are often dark text on
+        a transparent background whose stored RGB is black.
+        """
+        data = np.frombuffer(src, np.uint8) if isinstance(src, (bytes, bytearray)) else np.fromfile(src, np.uint8)
+        img = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError("Unsupported or corrupt image")
+        if img.dtype == np.uint16:
+            img = (img >> 8).astype(np.uint8)
+        if img.ndim == 2:
+            return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        if img.shape[2] == 4:
+            alpha = img[..., 3:].astype(np.float32) / 255.0
+            return (img[..., :3] * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+        return img
+
+    def needs_tiling(self, h, w):
+        return min(h, w) > self.MAX_SHORT_SIDE or max(h, w) > self.span_limit
+
+    def plan(self, h, w):
+        """Returns (scale, [(x0, y0, x1, y1), ...]) in scaled coordinates."""
+        scale = min(1.0, self.MAX_SHORT_SIDE / min(h, w))
+        h, w = int(h * scale), int(w * scale)
+
+        def spans(length):
+            if length <= self.span_limit:
+                return [(0, length)]
+            step = self.tile_size - self.OVERLAP
+            starts = list(range(0, length - self.OVERLAP, step))
+            return [(s, min(s + self.tile_size, length)) for s in starts]
+
+        # Full-width strips when the width fits the detector (cutting across a text line is
+        # worse); wider images are also split into columns, joined again in merge()
+        return scale, [(x0, y0, x1, y1) for y0, y1 in spans(h) for x0, x1 in spans(w)]
+
+    @staticmethod
+    def merge(lines):
+        """
+        Merges per-tile lines [(x0, y0, x1, y1, text, score, tile), ...] in image coordinates.
+        Duplicates from overlap bands are dropped (longer text wins); lines cut at a
+        vertical tile border are joined on their common suffix/prefix. Returns text lines
+        in reading order.
+        """
+        lines = sorted(lines, key=lambda l: (l[1], l[0]))
+        kept = []
+        for line in lines:
+            x0, y0, x1, y1, text, score, tile = line
+            merged = False
+            for k in range(len(kept) - 1, -1, -1):
+                kx0, ky0, kx1, ky1, ktext, kscore, ktile = kept[k]
+                if ky1 < y0 - (y1 - y0) * 2:
+                    break  # sorted by y: nothing further up can overlap
+                if ktile == tile: continue
+                v_overlap = min(y1, ky1) - max(y0, ky0)
+                h_overlap = min(x1, kx1) - max(x0, kx0)
+                if v_overlap <= 0.5 * min(y1 - y0, ky1 - ky0) or h_overlap <= 0:
+                    continue
+                inter = v_overlap * h_overlap
+                if inter > 0.6 * min((x1 - x0) * (y1 - y0), (kx1 - kx0) * (ky1 - ky0)):
+                    if len(text) > len(ktext): kept[k] = line
+                else:
+                    left, right = (ktext, text) if kx0 <= x0 else (text, ktext)
+                    n = next((n for n in range(min(len(left), len(right)), 1, -1) if left.endswith(right[:n])), 0)
+                    kept[k] = (min(x0, kx0), min(y0, ky0), max(x1, kx1), max(y1, ky1), left + right[n:], max(score, kscore), tile)
+                merged = True
+                break
+            if not merged:
+                kept.append(line)
+
+        # Reading order: rows by vertical center, then left to right
+        kept.sort(key=lambda l: (l[1] + l[3]) / 2)
+        rows, row = [], []
+        for line in kept:
+            if row and (line[1] + line[3]) / 2 - (row[-1][1] + row[-1][3]) / 2 > 0.5 * (line[3] - line[1]):
+                rows.append(row)
+                row = []
+            row.append(line)
+        if row: rows.append(row)
+        return [l[4] for r in rows for l in sorted(r, key=lambda l: l[0])]
+
+# ==========================================
+# PROCESS-PARALLEL PDF TEXT EXTRACTION
+# ==========================================
+_worker_pdf_readers = {}  # per worker process: (path, mtime, size) -> PdfReader
+
+def new_process_pool(processes=None):
+    """
+    Process pool for CPU-bound parsing (PDF text layers, code outlines). Workers come from
+    forkserver (or spawn) rather than fork: the parent is multi-threaded (fetch, OCR and source pools) by the time it needs one.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1, mp_context=context)
+
+def _pdf_text_range(path, start, stop, stop_at=None):
+    """
+    Process-pool worker: text layer of pages [start, stop). Each worker builds one PdfReader
+    over a read-only mmap of the file (reused for all its ranges), so pages are paged in by
+    the OS on demand instead of the whole PDF being read into every process.
+    Returns [(text, has_images, error), ...], cut short once time.time() passes `stop_at`.
+    """
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    reader = _worker_pdf_readers.get(key)
+    if reader is None:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _worker_pdf_readers.clear()
+        reader = _worker_pdf_readers[key] = pypdf.PdfReader(mm)
+
+    out = []
+    for i in range(start, stop):
+        if stop_at is not None and time.time() >= stop_at:
+            break
+        try:
+            page = reader.pages[i]
+            out.append((page.extract_text() or "", len(page.images) > 0, None))
+        except Exception as e:
+            out.append(("", False, str(e)))
+    return out
+
+def extract_pdf_text_parallel(executor, path, num_pages, cancel=None):
+    """
+    Extracts the text layer of every page on a process pool (pypdf is pure Python, so threads
+    stay GIL-bound). Pages are split into contiguous ranges, a few per worker for load balance;
+    results come back in page order as (text, has_images, error), or None for pages skipped
+    after `cancel` fired. Workers stop at the token's deadline; on any other cancellation the
+    remaining ranges are dropped without waiting for them.
+    """
+    cancel = cancel or CancelToken()
+    shards = min(num_pages, (os.cpu_count() or 1) * 4)
+    bounds = [num_pages * k // shards for k in range(shards + 1)]
+    remaining = cancel.remaining()
+    stop_at = time.time() + remaining if remaining is not None else None
+    results = [None] * num_pages
+    future_to_start = {executor.submit(_pdf_text_range, path, bounds[k], bounds[k + 1], stop_at): bounds[k]
+                       for k in range(shards)}
+    pending = set(future_to_start)
+    while pending and not cancel.cancelled:
+        done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+        for future in done:
+            start = future_to_start[future]
+            results[start:start + len(future.result())] = future.result()
+    for future in pending:
+        future.cancel()
+    return results
+
 # ==========================================
 # CONTENT PARSER
 # ==========================================
 class ContentParser:
+    PDF_PROCESS_MIN_PAGES = 64  # from this size, PDF text extraction moves to a process pool
+    MEMBER_MEMORY_MAX = 64 * 1024 * 1024  # larger archive members are spilled to a temp file
+
     def __init__(self):
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
         self.ocr_engine = None
+        self.ocr_lock = threading.Lock()
+        # Pooled keep-alive connections, shared by all fetch threads (and across daemon jobs)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(self.headers)
         self.drission_lock = threading.Lock()
+        self.doc_converter = None
+        self.doc_converter_lock = threading.Lock()
+        # Fetches run on their own pool so a slow HTTP request can be hedged with the browser
+        self.fetch_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="fetch")
+        self.fetch_stats = FetchStats()
+        self.hedge_percentile = None  # e.g. 95: hedge fetches slower than the recorded p95
+        self.web_ocr_limit = 0  # > 0: OCR up to this many article images per web page
+        # One process pool for large PDFs and code trees of a run (and across daemon jobs), created on first use
+        self.process_pool = None
+        self.process_pool_lock = threading.Lock()
+
+    def get_process_pool(self):
+        if not self.process_pool:
+            with self.process_pool_lock:
+                if not self.process_pool:
+                    self.process_pool = new_process_pool()
+        return self.process_pool
+
+    def discard_process_pool(self, pool):
+        """Drops a broken pool (a worker crashed, e.g. OOM) so the next get_process_pool() builds a new one."""
+        with self.process_pool_lock:
+            if self.process_pool is pool:
+                self.process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
 
     def get_ocr_engine(self):
         if not self.ocr_engine:
-            try:
-                self.ocr_engine = RapidOCR()
-            except Exception as e:
-                log(f"Failed to initialize RapidOCR: {e}")
+            with self.ocr_lock:
+                if not self.ocr_engine:
+                    try:
+                        self.ocr_engine = RapidOCR()
+                    except Exception as e:
+                        log(f"Failed to initialize RapidOCR: {e}")
         return self.ocr_engine
 
-    def perform_ocr(self, img_path):
+    def perform_ocr(self, img):
+        """OCRs an image given as a file path or raw image bytes"""
         engine = self.get_ocr_engine()
         if not engine: return "[OCR Failed: Engine not available]"
         
         try:
-            result, _ = engine(img_path)
+            result, _ = engine(img)
             if result:
                 text = "\n".join([line[1] for line in result])
                 return text
@@ -270,6 +1664,155 @@ class ContentParser:
         except Exception as e:
             return f"[OCR Error: {e}]"
 
+    OCR_REC_BATCH = 32        # text-line crops per recognition inference in batched mode
+    OCR_BATCH_IMAGES = 64     # images detected per group (bounds the crops held in memory)
+
+    def _detect_lines(self, engine, img):
+        """Detection half of RapidOCR's __call__: returns the sorted, perspective-cropped text lines."""
+        img = engine.load_img(img)
+        op_record = {}
+        img, ratio_h, ratio_w = engine.preprocess(img)
+        op_record["preprocess"] = {"ratio_h": ratio_h, "ratio_w": ratio_w}
+        img, op_record = engine.maybe_add_letterbox(img, op_record)
+        dt_boxes, _ = engine.auto_text_det(img)
+        return engine.get_crop_img_list(img, dt_boxes) if dt_boxes is not None else []
+
+    def ocr_batch(self, images, cancel=None):
+        """
+        OCRs many images (paths, bytes or arrays) at once. Text detection runs per image, in
+        parallel; the text-line crops of a whole group of images are then classified and
+        recognized together in OCR_REC_BATCH-sized inferences, and mapped back to their image in
+        line order. Returns one string per image, as perform_ocr would, or None for images
+        skipped after `cancel` fired (checked per image and before every inference).
+        Falls back to perform_ocr per image if batching fails.
+        """
+        cancel = cancel or CancelToken()
+        engine = self.get_ocr_engine()
+        if not engine: return ["[OCR Failed: Engine not available]"] * len(images)
+        if not all(hasattr(engine, a) for a in ("auto_text_det", "get_crop_img_list", "text_rec")):
+            return [None if cancel.cancelled else self.perform_ocr(img) for img in images]
+        # A private view of the recognizer (same ONNX session) with the larger batch size: the shared
+        # engine keeps its own, so perform_ocr output does not depend on whether a batch ran first
+        text_rec = copy.copy(engine.text_rec)
+        text_rec.rec_batch_num = max(text_rec.rec_batch_num, self.OCR_REC_BATCH)
+
+        def detect(i):
+            if cancel.cancelled: return None
+            return self._detect_lines(engine, images[i])
+
+        results = [None] * len(images)
+        for g in range(0, len(images), self.OCR_BATCH_IMAGES):
+            if cancel.cancelled:
+                break
+            group = range(g, min(len(images), g + self.OCR_BATCH_IMAGES))
+            try:
+                # 1. Detection, one image per task
+                crops, owners = [], []
+                with ThreadPoolExecutor(max_workers=min(len(group), os.cpu_count() or 4)) as executor:
+                    future_to_idx = {executor.submit(detect, i): i for i in group}
+                    for future in as_completed(future_to_idx):
+                        i = future_to_idx[future]
+                        try:
+                            lines = future.result()
+                        except Exception as e:
+                            results[i] = f"[OCR Error: {e}]"
+                            continue
+                        if lines is None: continue  # skipped: stays None
+                        results[i] = "[OCR: No text found]"
+                        crops.extend(lines)
+                        owners.extend((i, k) for k in range(len(lines)))
+                if not crops:
+                    continue
+
+                # 2. Classification + recognition across the whole group. Crops go in width/height
+                # order (as text_rec would sort them) so each chunk pads to a similar width.
+                order = sorted(range(len(crops)), key=lambda j: crops[j].shape[1] / float(crops[j].shape[0]))
+                rec_res = [None] * len(crops)
+                for c in range(0, len(order), self.OCR_REC_BATCH):
+                    if cancel.cancelled:
+                        break
+                    chunk = order[c:c + self.OCR_REC_BATCH]
+                    batch = [crops[j] for j in chunk]
+                    if engine.use_cls:
+                        batch, _, _ = engine.text_cls(batch)
+                    for j, res in zip(chunk, text_rec(batch)[0]):
+                        rec_res[j] = res
+
+                # 3. Back to per-image text, in detection (reading) order; images with lines
+                # left unrecognized at cancellation count as skipped
+                per_image, incomplete = {}, set()
+                for (i, k), res in sorted(zip(owners, rec_res), key=lambda x: x[0]):
+                    if res is None:
+                        incomplete.add(i)
+                    elif float(res[1]) >= engine.text_score:
+                        per_image.setdefault(i, []).append(res[0])
+                for i, lines in per_image.items():
+                    results[i] = "\n".join(lines)
+                for i in incomplete:
+                    results[i] = None
+            except Exception as e:
+                log_warning(f"Batched OCR failed ({e}); falling back to per-image OCR.")
+                for i in group:
+                    results[i] = None if cancel.cancelled else self.perform_ocr(images[i])
+        return results
+
+    def ocr_image(self, src, label="image", cancel=None):
+        """
+        OCR for direct image inputs. Oversized images (long screenshots, high-res photos) are
+        downscaled and split into overlapping tiles OCR'd in parallel; small ones go straight
+        to perform_ocr. Returns (text, stats_line or None, skipped_note or None); tiles are
+        skipped once `cancel` fires.
+        """
+        cancel = cancel or CancelToken()
+        engine = self.get_ocr_engine()
+        if not engine: return "[OCR Failed: Engine not available]", None, None
+
+        started = time.time()
+        tiler = ImageTiler(getattr(engine, "max_side_len", None))
+        try:
+            img = tiler.load(src)
+        except Exception as e:
+            return f"[OCR Error: {e}]", None, None
+        h, w = img.shape[:2]
+        if not tiler.needs_tiling(h, w):
+            return self.perform_ocr(img), None, None
+
+        scale, tiles = tiler.plan(h, w)
+        if scale < 1.0:
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        if len(tiles) == 1:
+            return self.perform_ocr(img), None, None  # only downscaled: nothing to tile or merge
+
+        def ocr_tile(idx):
+            if cancel.cancelled: return None
+            x0, y0, x1, y1 = tiles[idx]
+            result, _ = engine(np.ascontiguousarray(img[y0:y1, x0:x1]))
+            lines = []
+            for box, text, score in result or []:
+                xs, ys = [p[0] for p in box], [p[1] for p in box]
+                lines.append((min(xs) + x0, min(ys) + y0, max(xs) + x0, max(ys) + y0, text, float(score), idx))
+            return lines
+
+        all_lines, errors, skipped = [], 0, 0
+        with ThreadPoolExecutor(max_workers=min(len(tiles), os.cpu_count() or 4)) as executor:
+            for future in as_completed([executor.submit(ocr_tile, i) for i in range(len(tiles))]):
+                try:
+                    lines = future.result()
+                except Exception as e:
+                    errors += 1
+                    log_warning(f"{label}: tile OCR failed: {e}")
+                    continue
+                if lines is None:
+                    skipped += 1
+                else:
+                    all_lines.extend(lines)
+
+        text = "\n".join(ImageTiler.merge(all_lines)) or "[OCR: No text found]"
+        stats = (f"[IMAGE PREPROCESS] {w}x{h} -> {img.shape[1]}x{img.shape[0]} (scale {scale:.2f}), "
+                 f"{len(tiles)} tiles{f' ({errors} failed)' if errors else ''}, {time.time() - started:.1f}s")
+        log(f"{label}: {stats}")
+        return text, stats, f"{skipped}/{len(tiles)} tiles skipped" if skipped else None
+
     def clean_html(self, html, base_url=""):
         # Fix encoding if needed (UTF-8)
         if isinstance(html, bytes):
@@ -311,178 +1854,464 @@ class ContentParser:
         if meta_author: author = meta_author.get("content")
         return f"Title: {title}\nAuthor: {author}\nDate: {time.strftime('%Y-%m-%d')}\n"
 
-    def process_url(self, url):
-        log(f"Fetching: {url}")
-        html = ""
-        
+    def _http_fetch(self, url, cancel):
+        """Plain HTTP GET. Returns (html, err, wants_browser_fallback)."""
+        started = time.monotonic()
         try:
-            resp = requests.get(url, headers=self.headers, timeout=15)
+            resp = self.session.get(url, timeout=max(0.1, min(15, cancel.remaining(15))))
             if resp.status_code in [403, 429, 503]:
                 log(f"Requests {resp.status_code}. Invoking DrissionPage.")
-                with self.drission_lock:
-                    html, err = BrowserDriver.fetch_html(url)
-                if not html: return f"Error: {err}"
-            else:
-                resp.raise_for_status()
-                html = resp.text
+                return None, f"HTTP {resp.status_code}", True
+            resp.raise_for_status()
+            self.fetch_stats.record(time.monotonic() - started)
+            return resp.text, None, False
         except Exception as e:
             log(f"Requests failed: {e}. Invoking DrissionPage.")
-            with self.drission_lock:
-                html, err = BrowserDriver.fetch_html(url)
-            if not html: return f"Error: {err}"
+            return None, str(e), True
+
+    def _browser_fetch(self, url, cancel):
+        with self.drission_lock:
+            if cancel.cancelled:
+                return None, cancel.reason, False
+            html, err = BrowserDriver.fetch_html(url, timeout=min(BrowserDriver.TIMEOUT, cancel.remaining(BrowserDriver.TIMEOUT)))
+        return html, err, False
+
+    def fetch_page(self, url, cancel):
+        """
+        Returns (html, err). Plain HTTP first, the browser as fallback (403/429/503 or failure).
+        With hedging on, the browser also starts once HTTP has taken longer than the recorded
+        latency percentile; whichever returns HTML first wins.
+        """
+        http = self.fetch_pool.submit(self._http_fetch, url, cancel)
+        pending, browser, err = {http}, None, None
+
+        hedge_after = self.fetch_stats.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        if hedge_after is not None and not wait(pending, timeout=hedge_after).done:
+            log(f"HTTP slower than p{self.hedge_percentile:g} ({hedge_after:.2f}s). Hedging with DrissionPage: {url}")
+            browser = self.fetch_pool.submit(self._browser_fetch, url, cancel)
+            pending.add(browser)
+
+        while pending:
+            done, pending = wait(pending, timeout=cancel.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                return None, cancel.reason if cancel.cancelled else "deadline exceeded"
+            for future in done:
+                html, err, fallback = future.result()
+                if html:
+                    return html, None
+                if fallback and browser is None:
+                    browser = self.fetch_pool.submit(self._browser_fetch, url, cancel)
+                    pending.add(browser)
+        return None, err
+
+    def process_url(self, url, cancel=None):
+        cancel = (cancel or CancelToken()).start()
+        log(f"Fetching: {url}")
+        html, err = self.fetch_page(url, cancel)
+        if not html: return f"Error: {err}"
 
         meta = self.extract_metadata(html)
+        ocr_texts, token = {}, None
+        if self.web_ocr_limit:
+            html, ocr_texts, token = self.ocr_web_images(html, url, cancel)
         markdown = self.clean_html(html, base_url=url)
         
-        return f"{meta}\n=== CONTENT ===\n{markdown}"
-
-    def extract_images_from_docx(self, file_path):
-        """Extracts images from docx and performs OCR (Concurrent)"""
-        log("Extracting images from DOCX for OCR...")
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
+        return SourceDoc(meta, self._splice_web_ocr(markdown, ocr_texts, token))
+
+    # Optional web image OCR (--web-ocr): screenshots of code, formulas and diagrams in articles
+    WEB_IMAGE_ATTRS = ("data-original", "data-actualsrc", "data-src", "src")  # hi-res / lazy-load first
+    WEB_ARTICLE_SELECTORS = ("article", ".RichText", "#content_views", ".post-body", ".entry-content", "main")
+    WEB_IMAGE_MIN_SIDE = 48          # px, from width/height attributes: skips icons and avatars
+    WEB_IMAGE_MIN_BYTES = 2 * 1024
+    WEB_IMAGE_MAX_BYTES = 8 * 1024 * 1024
+
+    def collect_web_images(self, soup, base_url):
+        """Returns [(img_tag, absolute_src)] for article images in document order, deduplicated."""
+        root = next((el for el in (soup.select_one(sel) for sel in self.WEB_ARTICLE_SELECTORS) if el), None) or soup.body or soup
+        found, seen = [], set()
+        for img in root.find_all("img"):
+            src = next((img.get(a) for a in self.WEB_IMAGE_ATTRS if img.get(a) and not img.get(a).startswith("data:image/svg")), None)
+            if not src or src.lower().split("?")[0].endswith(".svg"):
+                continue
             try:
-                with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                    # Find image files
-                    image_files = [f for f in zip_ref.namelist() if f.startswith('word/media/') and f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-                    image_files.sort() # Keep order
-                    
-                    if not image_files:
-                        log("No images found in DOCX.")
-                        return ""
+                if any(int(str(img.get(d, "")).rstrip("px") or 0) < self.WEB_IMAGE_MIN_SIDE for d in ("width", "height") if img.get(d)):
+                    continue
+            except ValueError:
+                pass
+            src = src if src.startswith("data:") else urllib.parse.urljoin(base_url, src)
+            if src not in seen:
+                seen.add(src)
+                found.append((img, src))
+        return found
+
+    def _fetch_web_image(self, src, referer, cancel):
+        """Downloads one image over the pooled session. Returns (bytes, None) or (None, reason)."""
+        if cancel.cancelled:
+            return None, cancel.reason
+        if src.startswith("data:"):
+            header, _, payload = src.partition(",")
+            if not header.startswith("data:image/") or ";base64" not in header:
+                return None, "unsupported data URI"
+            try:
+                data = base64.b64decode(urllib.parse.unquote(payload))
+            except ValueError as e:  # binascii.Error
+                return None, f"malformed data URI: {e}"
+        else:
+            try:
+                # Referer: CSDN/Zhihu image hosts refuse hotlinked requests without it
+                with self.session.get(src, timeout=max(0.1, min(10, cancel.remaining(10))), stream=True,
+                                      headers={"Referer": referer}) as resp:
+                    resp.raise_for_status()
+                    ctype = resp.headers.get("Content-Type", "")
+                    if not ctype.startswith("image/") or "svg" in ctype:
+                        return None, f"content type {ctype or 'unknown'}"
+                    if int(resp.headers.get("Content-Length") or 0) > self.WEB_IMAGE_MAX_BYTES:
+                        return None, "too large"
+                    data = resp.raw.read(self.WEB_IMAGE_MAX_BYTES + 1, decode_content=True)
+            except Exception as e:
+                return None, str(e)
+        if len(data) > self.WEB_IMAGE_MAX_BYTES:
+            return None, "too large"
+        if len(data) < self.WEB_IMAGE_MIN_BYTES:
+            return None, "too small"
+        return data, None
+
+    def _ocr_cached(self, data, label, cancel):
+        """OCR keyed by the image's SHA-256 (config/cache/ocr), so repeated images are OCR'd once."""
+        cache_path = os.path.join(Config.get_cache_dir("ocr"), hashlib.sha256(data).hexdigest() + ".txt")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            pass
+        text, _, skipped = self.ocr_image(data, label, cancel)
+        if text.startswith("[OCR: No text"):
+            text = ""
+        elif text.startswith("[OCR") or skipped:
+            return None  # errors and partial results are not cached
+        tmp = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass
+        return text
+
+    def ocr_web_images(self, html, url, cancel):
+        """
+        Fetches up to `web_ocr_limit` article images concurrently and OCRs them. Images that yield
+        text are replaced in the DOM by a placeholder token (see _splice_web_ocr).
+        Returns (html, {image_no: text}, token).
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        images = self.collect_web_images(soup, url)
+        if not images:
+            return html, {}, None
+        if len(images) > self.web_ocr_limit:
+            log(f"{len(images)} article images; OCR limited to the first {self.web_ocr_limit}.")
+            images = images[:self.web_ocr_limit]
+
+        started, texts, dropped = time.time(), {}, 0
+        fetches = {self.fetch_pool.submit(self._fetch_web_image, src, url, cancel): n for n, (_, src) in enumerate(images, 1)}
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as ocr_pool:
+            ocr_futures = {}
+            for future in as_completed(fetches):
+                n = fetches[future]
+                try:
+                    data, reason = future.result()
+                except Exception as e:
+                    data, reason = None, str(e)
+                if data is None:
+                    dropped += 1
+                    log(f"Web image {n} skipped: {reason}")
+                    continue
+                ocr_futures[ocr_pool.submit(self._ocr_cached, data, f"{url} image {n}", cancel)] = n
+            for future in as_completed(ocr_futures):
+                try:
+                    text = future.result()
+                except Exception as e:
+                    log_warning(f"Web image OCR failed: {e}")
+                    continue
+                if text:
+                    texts[ocr_futures[future]] = text
+        log(f"Web image OCR: {len(texts)}/{len(images)} images with text ({dropped} filtered or failed) in {time.time() - started:.1f}s")
+        if not texts:
+            return html, {}, None
+
+        token = f"WEBOCR{uuid.uuid4().hex[:8]}N"
+        for n, (img, _) in enumerate(images, 1):
+            if n in texts:
+                # A link wrapping only the image goes too, so no dangling "[](href)" is left behind
+                target = img.parent if img.parent and img.parent.name == "a" and len(img.parent.get_text(strip=True)) == 0 else img
+                target.replace_with(soup.new_string(f" {token}{n}E "))
+        return str(soup), texts, token
+
+    def _splice_web_ocr(self, markdown, texts, token):
+        """Turns the Markdown into Segments, putting each image's OCR text where the image was."""
+        if not texts:
+            return markdown_sections(markdown, origin="html")
+        segments = []
+        for k, part in enumerate(re.split(rf'[ \t]*{token}(\d+)E[ \t]*', markdown)):
+            if k % 2 == 0:
+                segments.extend(markdown_sections(part, origin="html"))
+            else:
+                n, text = int(part), texts[int(part)]
+                segments.append(Segment("image", text, f"\n[IMAGE {n} CONTENT (OCR)]:\n{text}\n", origin="ocr", image=n))
+        return segments
+
+    def extract_images_from_docx(self, doc, rel_ids, cancel=None):
+        """OCRs the given DOCX image relationships as one batch. Returns {rId: text}; None if skipped."""
+        cancel = cancel or CancelToken()
+        # Resolve each relationship to its image blob (package is already in memory)
+        blobs = {}
+        for r_id in rel_ids:
+            part = doc.part.related_parts.get(r_id)
+            if part is None or not hasattr(part, "blob"):
+                continue
+            if not str(part.partname).lower().endswith(DOCX_OCR_IMAGE_EXTS):
+                continue
+            blobs[r_id] = part.blob
+
+        if not blobs:
+            if rel_ids: log("No OCR-able images found in DOCX.")
+            return {}
+
+        log(f"Found {len(blobs)} images. OCR in batches...")
+        return dict(zip(blobs, self.ocr_batch(list(blobs.values()), cancel)))
+
+    def _docx_paragraph_parts(self, p_el, image_refs):
+        """Walks a <w:p> in document order. Returns a list of text strings and image refs"""
+        parts = []
+        stack = [p_el]
+        while stack:
+            el = stack.pop()
+            if el.tag == DOCX_TAG_MC_FALLBACK:
+                continue  # mc:AlternateContent repeats the mc:Choice content (text boxes, VML images)
+            stack.extend(reversed(el))
+            if el.tag == DOCX_TAG_T:
+                parts.append(el.text or "")
+            elif el.tag == DOCX_TAG_TAB:
+                parts.append("\t")
+            elif el.tag in (DOCX_TAG_BR, DOCX_TAG_CR):
+                parts.append("\n")
+            elif el.tag in (DOCX_TAG_BLIP, DOCX_TAG_IMAGEDATA):
+                r_id = el.get(DOCX_ATTR_EMBED) or el.get(DOCX_ATTR_ID)
+                if r_id:
+                    ref = DocxImageRef(len(image_refs) + 1, r_id)
+                    image_refs.append(ref)
+                    parts.append(ref)
+        return parts
+
+    def _docx_table_to_markdown(self, tbl_el, doc, image_refs):
+        """Renders a <w:tbl> as a Markdown table. Images in cells become [IMAGE n] markers"""
+        table = docx.table.Table(tbl_el, doc)
+        cell_refs = []
+        rendered = {}  # merged cells repeat the same <w:tc>; render (and count images) once
+        rows = []
+        for row in table.rows:
+            cells = []
+            for cell in row.cells:
+                if cell._tc in rendered:
+                    cells.append(rendered[cell._tc])
+                    continue
+                lines = []
+                # Direct paragraphs of the cell; nested tables are flattened to their paragraphs
+                cell_paras = []
+                for child in cell._tc.iterchildren():
+                    if child.tag == DOCX_TAG_P: cell_paras.append(child)
+                    elif child.tag == DOCX_TAG_TBL: cell_paras.extend(child.iter(DOCX_TAG_P))
+                for p_el in cell_paras:
+                    text = ""
+                    for part in self._docx_paragraph_parts(p_el, image_refs):
+                        if isinstance(part, DocxImageRef):
+                            cell_refs.append(part)
+                            text += f"[IMAGE {part.index}]"
+                        else:
+                            text += part
+                    if text.strip(): lines.append(text.strip())
+                rendered[cell._tc] = "<br>".join(lines).replace("|", "\\|").replace("\n", "<br>")
+                cells.append(rendered[cell._tc])
+            rows.append(cells)
+
+        if not rows:
+            return [], cell_refs
+
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+        md = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * width]
+        md += ["| " + " | ".join(r) + " |" for r in rows[1:]]
+        return md, cell_refs
+
+    def _extract_docx_content(self, file_path, cancel=None):
+        """Walks the DOCX body in document order (paragraphs, tables, inline images).
+        OCR text is spliced in at the position where each image appears. Returns a list of Segments."""
+        doc = docx.Document(file_path)
 
-                    log(f"Found {len(image_files)} images. Processing concurrently...")
-                    
-                    results_map = {}
-                    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-                        future_to_img = {}
-                        for i, img_file in enumerate(image_files):
-                            # Extract
-                            zip_ref.extract(img_file, temp_dir)
-                            full_path = os.path.join(temp_dir, img_file)
-                            future_to_img[executor.submit(self.perform_ocr, full_path)] = (i, img_file)
-                        
-                        for future in as_completed(future_to_img):
-                            idx, img_name = future_to_img[future]
-                            try:
-                                text = future.result()
-                                if text and not text.startswith("[OCR"):
-                                    results_map[idx] = f"\n[IMAGE {idx+1} CONTENT (OCR)]:\n{text}\n"
-                                else:
-                                    results_map[idx] = f"\n[IMAGE {idx+1}]: {text}\n"
-                            except Exception as e:
-                                results_map[idx] = f"\n[IMAGE {idx+1}]: OCR Error: {e}\n"
-                            
-            except zipfile.BadZipFile:
-                log("Failed to unzip DOCX. Is it valid?")
-                return "\n[ERROR: Failed to extract images from DOCX]"
-                
-        # Combine in order
-        ocr_results = [results_map[i] for i in range(len(image_files))]
-        return "\n=== DETECTED IMAGE TEXT ===\n" + "\n".join(ocr_results) if ocr_results else ""
+        # 1. Walk body: blocks are text lines or DocxImageRef placeholders
+        blocks = []
+        image_refs = []
+        for child in doc.element.body.iterchildren():
+            if child.tag == DOCX_TAG_P:
+                line = ""
+                for part in self._docx_paragraph_parts(child, image_refs):
+                    if isinstance(part, DocxImageRef):
+                        blocks.append(line)
+                        blocks.append(part)
+                        line = ""
+                    else:
+                        line += part
+                blocks.append(line)
+            elif child.tag == DOCX_TAG_TBL:
+                md, cell_refs = self._docx_table_to_markdown(child, doc, image_refs)
+                if md:
+                    blocks.append("")
+                    blocks.extend(md)
+                    blocks.append("")
+                # OCR text of images inside cells follows the table
+                blocks.extend(cell_refs)
+
+        # 2. OCR every distinct image once, concurrently
+        ocr_map = self.extract_images_from_docx(doc, list(dict.fromkeys(ref.r_id for ref in image_refs)), cancel)
+
+        # 3. Splice OCR text back in document order (runs of body text become one segment)
+        out = []
+        for block in blocks:
+            if isinstance(block, DocxImageRef):
+                text = ocr_map.get(block.r_id)
+                if text is None:
+                    continue
+                if text and not text.startswith("[OCR"):
+                    out.append(Segment("image", text, f"\n[IMAGE {block.index} CONTENT (OCR)]:\n{text}\n", origin="ocr", image=block.index))
+                else:
+                    out.append(Segment("image", "", f"\n[IMAGE {block.index}]: {text}\n", origin="ocr", image=block.index))
+            else:
+                out.append(Segment("section", block))
+
+        segments = []
+        for k, seg in enumerate(out):
+            if k < len(out) - 1:
+                seg.rendered += "\n"
+            if seg.kind == "section" and segments and segments[-1].kind == "section":
+                segments[-1].text += "\n" + seg.text
+                segments[-1].rendered += seg.rendered
+            else:
+                segments.append(seg)
 
-    def _extract_docx_content(self, file_path):
-        # Text extraction
-        doc = docx.Document(file_path)
-        text_content = '\n'.join([para.text for para in doc.paragraphs])
-        
-        # Image OCR extraction
-        image_content = self.extract_images_from_docx(file_path)
-        
-        return text_content + "\n" + image_content
-
-    def _process_pdf_page(self, page_idx, page):
-        """Processes a single PDF page: text + images (OCR)"""
-        content = ""
-        # Text
-        page_text = page.extract_text()
-        if page_text:
-            content += f"\n=== PAGE {page_idx+1} TEXT ===\n{page_text}\n"
-        
-        # Images
+        skipped = sum(1 for text in ocr_map.values() if text is None)
+        if skipped:
+            segments.append(partial_segment(cancel.reason, f"OCR skipped for {skipped}/{len(ocr_map)} images"))
+        return segments
+
+    def _process_pdf_page(self, page_idx, page, cancel=None):
+        """Processes a single PDF page: text + images (OCR). Returns a list of Segments, or None if cancelled."""
+        if cancel and cancel.cancelled:
+            return None
+        return self._pdf_text_segments(page_idx, page.extract_text()) + self._ocr_pdf_page_images(page_idx, page, cancel)
+
+    def _pdf_text_segments(self, page_idx, page_text):
+        if not page_text:
+            return []
+        return [Segment("page", page_text, f"\n=== PAGE {page_idx+1} TEXT ===\n{page_text}\n", page=page_idx+1)]
+
+    def _ocr_pdf_page_images(self, page_idx, page, cancel=None):
+        """OCRs the images embedded in a PDF page as one batch. Returns a list of Segments."""
+        segments = []
         try:
-            images = page.images
-            if images:
-                for j, image in enumerate(images):
-                    ext = os.path.splitext(image.name)[1] or ".png"
-                    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_img:
-                        tmp_img.write(image.data)
-                        tmp_img_path = tmp_img.name
-                    
-                    ocr_text = self.perform_ocr(tmp_img_path)
-                    if ocr_text and not ocr_text.startswith("[OCR") and not ocr_text.startswith("[OCR: No text"):
-                        content += f"\n[PAGE {page_idx+1} IMAGE {j+1} CONTENT (OCR)]:\n{ocr_text}\n"
-                    
-                    try: os.remove(tmp_img_path)
-                    except: pass
+            datas = {}
+            for j, image in enumerate(page.images):
+                try:
+                    datas[j] = image.data
+                except Exception as img_err:
+                    log(f"Error reading image {j+1} on page {page_idx+1}: {img_err}")
+            texts = self.ocr_batch(list(datas.values()), cancel) if datas else []
+            for j, ocr_text in zip(datas, texts):
+                if ocr_text and not ocr_text.startswith("[OCR"):
+                    segments.append(Segment("image", ocr_text, f"\n[PAGE {page_idx+1} IMAGE {j+1} CONTENT (OCR)]:\n{ocr_text}\n",
+                                            origin="ocr", page=page_idx+1, image=j+1))
+            skipped = sum(1 for text in texts if text is None)
+            if skipped:
+                segments.append(partial_segment(cancel.reason, f"OCR skipped for {skipped}/{len(texts)} images on page {page_idx+1}", page=page_idx+1))
         except Exception as img_err:
             log(f"Error extracting images from page {page_idx+1}: {img_err}")
             
-        return content
+        return segments
 
-    def _extract_pdf_content(self, file_path):
-        log(f"Extracting content from PDF: {file_path} (Concurrent)")
+    def _extract_pdf_content(self, file_path, label=None, cancel=None):
+        log(f"Extracting content from PDF: {label or file_path} (Concurrent)")
+        cancel = cancel or CancelToken()
         try:
             reader = pypdf.PdfReader(file_path)
             num_pages = len(reader.pages)
-            log(f"PDF has {num_pages} pages. Processing concurrently...")
+
+            # Large PDFs on disk: text layer in worker processes, one page range each
+            texts = None
+            if isinstance(file_path, str) and num_pages >= self.PDF_PROCESS_MIN_PAGES and (os.cpu_count() or 1) > 1:
+                log(f"PDF has {num_pages} pages. Extracting text in {os.cpu_count()} processes...")
+                pool = None
+                try:
+                    pool = self.get_process_pool()
+                    texts = extract_pdf_text_parallel(pool, file_path, num_pages, cancel)
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool): self.discard_process_pool(pool)
+                    log_warning(f"Process pool unavailable ({e}); extracting with threads.")
+            if texts is None:
+                log(f"PDF has {num_pages} pages. Processing concurrently...")
             
             results_map = {}
             with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-                future_to_page = {executor.submit(self._process_pdf_page, i, reader.pages[i]): i for i in range(num_pages)}
+                if texts is None:
+                    future_to_page = {executor.submit(self._process_pdf_page, i, reader.pages[i], cancel): i for i in range(num_pages)}
+                else:
+                    # Text is done; only pages with images still need the reader, for OCR
+                    future_to_page = {}
+                    for i, extracted in enumerate(texts):
+                        if extracted is None:
+                            results_map[i] = None
+                            continue
+                        text, has_images, err = extracted
+                        if err:
+                            results_map[i] = [Segment("error", err, f"\n[ERROR processing PAGE {i+1}: {err}]", page=i+1)]
+                            continue
+                        results_map[i] = self._pdf_text_segments(i, text)
+                        if has_images:
+                            future_to_page[executor.submit(self._ocr_pdf_page_images, i, reader.pages[i], cancel)] = i
                 
                 for future in as_completed(future_to_page):
                     idx = future_to_page[future]
                     try:
-                        results_map[idx] = future.result()
+                        segments = future.result()
                     except Exception as e:
-                        results_map[idx] = f"\n[ERROR processing PAGE {idx+1}: {e}]"
+                        segments = [Segment("error", str(e), f"\n[ERROR processing PAGE {idx+1}: {e}]", page=idx+1)]
+                    results_map[idx] = segments if texts is None else results_map[idx] + segments
             
-            # Combine in order
-            full_content = "".join([results_map[i] for i in range(num_pages)])
-            return full_content
+            # Combine in order; pages skipped after cancellation are left out and flagged
+            segments = [seg for i in range(num_pages) if results_map[i] is not None for seg in results_map[i]]
+            skipped = sum(1 for i in range(num_pages) if results_map[i] is None)
+            if skipped:
+                segments.append(partial_segment(cancel.reason, f"{num_pages - skipped}/{num_pages} pages processed"))
+            return segments
                     
         except Exception as e:
-            return f"\n[ERROR processing PDF: {e}]"
+            return [Segment("error", str(e), f"\n[ERROR processing PDF: {e}]")]
 
     def convert_doc_to_docx(self, doc_path):
-        if not IS_WINDOWS:
-            return None, "System is not Windows. .doc conversion requires Microsoft Word COM API (Windows only)."
-
-        try:
-            import win32com.client
-            import pythoncom
-        except ImportError:
-            return None, "pywin32 not installed. Cannot process .doc files."
-
-        word = None
-        temp_docx = os.path.join(tempfile.gettempdir(), f"converted_{int(time.time())}.docx")
-        try:
-            # Initialize COM
-            pythoncom.CoInitialize()
-            try:
-                word = win32com.client.Dispatch("Word.Application")
-            except Exception:
-                # Try dispatch ex if standard dispatch fails (sometimes helps)
-                word = win32com.client.DispatchEx("Word.Application")
-            
-            if not word: return None, "Failed to initialize Word Application"
-
-            word.Visible = False
-            word.DisplayAlerts = 0
-            
-            doc = word.Documents.Open(os.path.abspath(doc_path))
-            doc.SaveAs2(temp_docx, FileFormat=16) # 16 = wdFormatXMLDocument (docx)
-            doc.Close()
-            return temp_docx, None
-        except Exception as e:
-            return None, str(e)
-        finally:
-            if word:
-                try: word.Quit()
-                except: pass
-
-    def process_file(self, file_path):
+        """Returns (docx_path, error). The converted file is cached by content hash."""
+        with self.doc_converter_lock:
+            if self.doc_converter is None:
+                self.doc_converter = DocConverter()
+        return self.doc_converter.convert(doc_path)
+
+    def _open_text_stream(self, opener, meta, ext, label):
+        """Returns a streaming text source, or an error string for binary files."""
+        stream = TextStream(opener, meta)
+        encoding = stream.sniff()
+        if not encoding:
+            return f"{meta}\n=== ERROR ===\nUnsupported file format: {ext}"
+        log(f"Streaming text ({encoding}): {label}")
+        return stream
+
+    def process_file(self, file_path, cancel=None):
         log(f"Processing file: {file_path}")
         if not os.path.exists(file_path):
             return f"Error: File not found: {file_path}"
@@ -490,59 +2319,214 @@ class ContentParser:
         ext = os.path.splitext(file_path)[1].lower()
         filename = os.path.basename(file_path)
         meta = f"Title: {filename}\nSource: Local File\nDate: {time.strftime('%Y-%m-%d')}\n"
-        content = ""
+        return self._process_source(ext, meta, lambda: open(file_path, "rb"), filename, path=file_path, cancel=cancel)
+
+    def process_member(self, member, cancel=None):
+        """Processes one file from a directory or .zip input (see iter_container_members)"""
+        log(f"Processing member: {member.label}")
+        meta = f"Title: {member.name}\nSource: {member.container}\nDate: {time.strftime('%Y-%m-%d')}\n"
+        return self._process_source(member.ext, meta, member.opener, member.label, path=member.path, cancel=cancel)
+
+    def process_code(self, path, include=None, exclude=None, budget=None, cancel=None):
+        """Code ingestion mode: outline + call graph + budgeted bodies for a file, directory or .zip"""
+        log(f"Indexing code: {path}")
+        if not os.path.exists(path):
+            return f"Error: File not found: {path}"
+        cancel = (cancel or CancelToken()).start()
+        if cancel.cancelled:
+            return f"Error: {Config.PARTIAL_MSG.format(reason=f'{cancel.reason}; not started')}"
+        if is_container(path):
+            members = iter_container_members(path, include, exclude)
+            kind = "Code Repository"
+        else:
+            members = [SourceMember(os.path.dirname(os.path.abspath(path)), os.path.basename(path),
+                                    functools.partial(open, path, "rb"), path=path)]
+            kind = "Code File"
+        meta = f"Title: {os.path.basename(os.path.normpath(path))}\nSource: {kind}\nDate: {time.strftime('%Y-%m-%d')}\n"
+        indexer = CodeIndexer(budget, cancel, self.get_process_pool, self.discard_process_pool)
+        try:
+            content = indexer.index(members)
+        except Exception as e:
+            return f"{meta}\n=== ERROR ===\nFailed to index code: {str(e)}"
+        segments = [Segment("section", content, origin="code")]
+        if indexer.unindexed:
+            segments.append(partial_segment(cancel.reason, f"{indexer.unindexed} files not indexed"))
+        return SourceDoc(meta, segments)
+
+    def _process_source(self, ext, meta, opener, label, path=None, cancel=None):
+        """
+        Dispatches a source to the right extractor by extension.
+        `path` is set for files on disk; archive members are read through `opener` into memory,
+        or spilled to a temp file when larger than MEMBER_MEMORY_MAX.
+        `cancel` (a CancelToken) is polled by the page/image workers; skipped work is flagged.
+        """
+        segments = []
+        cancel = (cancel or CancelToken()).start()
+        if cancel.cancelled:
+            return f"{meta}\n=== ERROR ===\n{Config.PARTIAL_MSG.format(reason=f'{cancel.reason}; not started')}"
+
+        spill = contextlib.ExitStack()
+
+        def load():
+            if path: return path
+            with opener() as f:
+                data = f.read(self.MEMBER_MEMORY_MAX + 1)
+                if len(data) <= self.MEMBER_MEMORY_MAX:
+                    return io.BytesIO(data)
+                tmp_path = os.path.join(spill.enter_context(tempfile.TemporaryDirectory()), "member" + ext)
+                with open(tmp_path, "wb") as dst:
+                    dst.write(data)
+                    del data
+                    shutil.copyfileobj(f, dst)
+                return tmp_path
 
         try:
             if ext == '.txt':
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        content = f.read()
+                return self._open_text_stream(opener, meta, ext, label)
             
             elif ext == '.docx':
-                content = self._extract_docx_content(file_path)
+                segments = self._extract_docx_content(load(), cancel)
             
             elif ext == '.doc':
                 log("Detected .doc file. Attempting conversion to .docx...")
-                temp_docx, err = self.convert_doc_to_docx(file_path)
-                if temp_docx and os.path.exists(temp_docx):
-                    content = self._extract_docx_content(temp_docx)
-                    # Cleanup
-                    try: os.remove(temp_docx)
-                    except: pass
+                if path:
+                    docx_path, err = self.convert_doc_to_docx(path)
+                else:
+                    # The converter works on files: spill the archive member to a private temp file
+                    with tempfile.TemporaryDirectory() as tmp_dir:
+                        tmp_doc = os.path.join(tmp_dir, "member.doc")
+                        with opener() as src, open(tmp_doc, "wb") as dst:
+                            shutil.copyfileobj(src, dst)
+                        docx_path, err = self.convert_doc_to_docx(tmp_doc)
+                if docx_path and os.path.exists(docx_path):
+                    segments = self._extract_docx_content(docx_path, cancel)
                 else:
-                    return f"{meta}\n=== ERROR ===\nFailed to convert .doc file: {err}\nPlease ensure Microsoft Word is installed or convert to .docx manually."
+                    return f"{meta}\n=== ERROR ===\nFailed to convert .doc file: {err}\nPlease install LibreOffice (or Microsoft Word on Windows) or convert to .docx manually."
 
             elif ext == '.pdf':
-                content = self._extract_pdf_content(file_path)
+                segments = self._extract_pdf_content(load(), label, cancel)
             
             elif ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-                # Direct image OCR
-                content = self.perform_ocr(file_path)
+                # Direct image OCR (tiled/downscaled when oversized)
+                src = load()
+                content, stats, skipped = self.ocr_image(src if isinstance(src, str) else src.getvalue(), label, cancel)
+                segments = [Segment("image", content, f"{stats}\n\n{content}" if stats else content, origin="ocr")]
+                if skipped: segments.append(partial_segment(cancel.reason, skipped))
             
+            elif ext in CONTAINER_EXTS:
+                return f"{meta}\n=== ERROR ===\nNested archives are not supported: {label}"
+
             else:
                 log(f"Unknown extension {ext}, trying as text...")
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except:
-                    return f"{meta}\n=== ERROR ===\nUnsupported file format: {ext}"
+                return self._open_text_stream(opener, meta, ext, label)
 
         except Exception as e:
             # import traceback
             # traceback.print_exc()
             return f"{meta}\n=== ERROR ===\nFailed to process file: {str(e)}"
+        finally:
+            spill.close()
 
-        return f"{meta}\n=== CONTENT ===\n{content}"
+        return SourceDoc(meta, segments)
 
 # ==========================================
 # TRUTH ANCHORING & CONFLICT DETECTION (2026)
 # ==========================================
+DEFAULT_ENTITIES = ["Milvus", "Zilliz", "Pinecone", "Weaviate", "Qdrant", "Chroma"]
+DEFAULT_METRICS = ["QPS", "Recall", "Latency", "Precision", "Throughput", "Cost"]
+_ASCII_WORD = frozenset("abcdefghijklmnopqrstuvwxyz0123456789_")
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick matcher over a dictionary of terms. A single left-to-right pass reports every
+    occurrence of every term, so scanning stays linear in the text however large the dictionary.
+    Matching ignores case; terms that begin/end with an ASCII word character must sit on a word
+    boundary there ("Cost" does not match "Costume", CJK terms match anywhere).
+    """
+
+    def __init__(self, terms):
+        self.goto = [{}]   # state -> {char: state}
+        self.fail = [0]
+        self.out = [()]    # state -> ((term, length, left_bounded, right_bounded), ...)
+        seen = set()
+        for term in terms:
+            key = term.lower()
+            if key and key not in seen:
+                seen.add(key)
+                self._add(term, key)
+        self._link()
+
+    def _add(self, term, key):
+        state = 0
+        for ch in key:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+                self.goto[state][ch] = nxt
+            state = nxt
+        self.out[state] += ((term, len(key), key[0] in _ASCII_WORD, key[-1] in _ASCII_WORD),)
+
+    def _link(self):
+        # BFS from the root: each failure link points at the longest proper suffix that is also
+        # a trie prefix, and outputs are inherited along it so overlapping terms are all reported
+        pending = collections.deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self.goto[state].items():
+                pending.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def finditer(self, text):
+        """Yields (start, end, term) for every occurrence, ordered by end position."""
+        low = text.lower()
+        if len(low) != len(text):
+            # A few characters (e.g. 'İ') grow when lowercased; keep offsets aligned with `text`
+            low = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+        goto, fail, out = self.goto, self.fail, self.out
+        size = len(low)
+        state = 0
+        for i, ch in enumerate(low):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for term, n, left, right in out[state]:
+                start = i - n + 1
+                if left and start > 0 and low[start - 1] in _ASCII_WORD: continue
+                if right and i + 1 < size and low[i + 1] in _ASCII_WORD: continue
+                yield start, i + 1, term
+
 class ConflictDetector:
-    def __init__(self):
+    """
+    Cross-source checks driven by two dictionaries under config/ (entities.txt, metrics.txt;
+    created with defaults on first use). Each source is scanned once by a KeywordAutomaton.
+    """
+    WINDOW_BEFORE = 100
+    WINDOW_AFTER = 200
+    POSITIVE_WORDS = ("best", "fast", "superior")
+    NEGATIVE_WORDS = ("slow", "expensive", "complex")
+
+    def __init__(self, entities=None, metrics=None):
         self.claims = []
+        self.entities = Config.load_dictionary("entities", DEFAULT_ENTITIES) if entities is None else list(entities)
+        self.metrics = Config.load_dictionary("metrics", DEFAULT_METRICS) if metrics is None else list(metrics)
+        self.matcher = KeywordAutomaton(self.entities + self.metrics)
+
+    def scan(self, content):
+        """One pass over a source. Returns {term: [(start, end, window), ...]} for every occurrence."""
+        hits = {}
+        for start, end, term in self.matcher.finditer(content):
+            window = content[max(0, start - self.WINDOW_BEFORE):end + self.WINDOW_AFTER]
+            hits.setdefault(term, []).append((start, end, window))
+        return hits
 
     def detect_conflicts(self, contents):
         """
@@ -551,40 +2535,29 @@ class ConflictDetector:
         """
         log("Running multi-source conflict detection...", "yellow")
         conflicts = []
+        scans = [self.scan(content) for content in contents]
         
         # 1. Numerical Conflict Detection
-        all_numbers = {}
-        for idx, content in enumerate(contents):
-            # Focus on performance metrics (QPS, Recall, Latency)
-            nums = re.findall(r'\d+(?:\.\d+)?', content)
-            all_numbers[idx] = set(nums)
-            
         for i in range(len(contents)):
             for j in range(i + 1, len(contents)):
-                # Find overlapping numbers that might be conflicting values for the same metric
+                # The same metric reported with different values
                 # This is heuristic-based
-                shared_context = self._find_shared_context(contents[i], contents[j])
+                shared_context = self._find_shared_context(scans[i], scans[j])
                 if shared_context:
                     for context in shared_context:
-                        val1 = self._extract_value_for_context(contents[i], context)
-                        val2 = self._extract_value_for_context(contents[j], context)
+                        val1 = self._extract_value_for_context(scans[i][context])
+                        val2 = self._extract_value_for_context(scans[j][context])
                         if val1 and val2 and val1 != val2:
                             conflicts.append(f"Conflict in '{context}': Source {i+1} says {val1}, Source {j+1} says {val2}")
 
         # 2. Claim-based Conflict (Heuristic)
-        # Search for opposing sentiment words near keywords
-        keywords = ["Milvus", "Zilliz", "Pinecone", "Weaviate", "Qdrant", "Chroma"]
-        for kw in keywords:
+        # Search for opposing sentiment words near every mention of an entity
+        for kw in self.entities:
             sentiments = []
-            for idx, content in enumerate(contents):
-                if kw in content:
-                    # Very simple sentiment heuristic
-                    pos = content.find(kw)
-                    window = content[max(0, pos-100):min(len(content), pos+200)]
-                    if "best" in window.lower() or "fast" in window.lower() or "superior" in window.lower():
-                        sentiments.append((idx+1, "Positive"))
-                    elif "slow" in window.lower() or "expensive" in window.lower() or "complex" in window.lower():
-                        sentiments.append((idx+1, "Negative"))
+            for idx, hits in enumerate(scans):
+                sentiment = self._window_sentiment(hits.get(kw, ()))
+                if sentiment:
+                    sentiments.append((idx+1, sentiment))
             
             # If we have mixed sentiments, log as conflict
             if len(set([s[1] for s in sentiments])) > 1:
@@ -593,18 +2566,27 @@ class ConflictDetector:
 
         return conflicts
 
-    def _find_shared_context(self, text1, text2):
-        # Look for common entities or metrics
-        metrics = ["QPS", "Recall", "Latency", "Precision", "Throughput", "Cost"]
-        shared = [m for m in metrics if m.lower() in text1.lower() and m.lower() in text2.lower()]
-        return shared
-
-    def _extract_value_for_context(self, text, context):
-        # Extract the number closest to the context word
-        pattern = rf"{context}.*?(\d+(?:\.\d+)?)"
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        if match:
-            return match.group(1)
+    def _window_sentiment(self, occurrences):
+        # Very simple sentiment heuristic: majority vote over the windows of all mentions
+        score = 0
+        for _, _, window in occurrences:
+            low = window.lower()
+            if any(w in low for w in self.POSITIVE_WORDS):
+                score += 1
+            elif any(w in low for w in self.NEGATIVE_WORDS):
+                score -= 1
+        return "Positive" if score > 0 else "Negative" if score < 0 else None
+
+    def _find_shared_context(self, hits1, hits2):
+        # Metrics mentioned by both sources
+        return [m for m in self.metrics if m in hits1 and m in hits2]
+
+    def _extract_value_for_context(self, occurrences):
+        # The first number following a mention of the metric (within its window)
+        for start, end, window in occurrences:
+            match = re.search(r"\d+(?:\.\d+)?", window[end - max(0, start - self.WINDOW_BEFORE):])
+            if match:
+                return match.group(0)
         return None
 
 # ==========================================
@@ -662,18 +2644,76 @@ class FeishuMarkdownGenerator:
 # REPORT GENERATION (LCS Glassmorphism 2.0)
 # ==========================================
 class ReportGenerator:
+    # Precompiled stand-in for the Tailwind utilities the online report uses. No network,
+    # no in-browser CSS compilation, no backdrop-filter (blur repaints on every scroll).
+    OFFLINE_CSS = """
+        *, *::before, *::after { box-sizing: border-box; }
+        body { margin: 0; padding: 2rem 1rem; font-family: var(--font-main), system-ui, -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif;
+               background: var(--bg-gradient); background-attachment: fixed; color: var(--text-main); line-height: 1.6; }
+        .glass-panel { background: var(--glass-bg); border: 1px solid var(--glass-border); border-radius: 1rem; box-shadow: 0 4px 6px -1px rgb(0 0 0 / 0.1); }
+        nav { position: sticky; top: 0.5rem; z-index: 50; max-width: 72rem; margin: 0 auto; padding: 0.75rem 1.5rem;
+              display: flex; align-items: center; gap: 1rem; flex-wrap: wrap; }
+        nav .brand { font-weight: 700; font-size: 1.25rem; }
+        nav .links { margin-left: auto; display: flex; gap: 1.5rem; font-weight: 600; }
+        nav a { color: inherit; text-decoration: none; }
+        nav a:hover { color: var(--primary); }
+        nav input { flex: 1; min-width: 10rem; max-width: 24rem; padding: 0.5rem 1rem; border-radius: 9999px; border: 1px solid var(--glass-border); background: transparent; color: inherit; }
+        nav button { padding: 0.4rem 0.6rem; border-radius: 9999px; border: 1px solid var(--glass-border); background: transparent; cursor: pointer; }
+        main { max-width: 72rem; margin: 2rem auto 0; display: flex; flex-direction: column; gap: 2rem; }
+        section { padding: 2rem; }
+        h1 { font-size: 1.875rem; margin: 0 0 1rem; }
+        h2 { font-size: 1.5rem; margin: 0 0 1.5rem; }
+        .muted { opacity: 0.7; font-size: 0.875rem; }
+        .conflict { padding: 1rem; margin-bottom: 1rem; border-radius: 0.5rem; font-size: 0.875rem; color: #b91c1c; background: rgb(254 242 242 / 0.5); border: 1px solid #fee2e2; }
+        details.src { margin-bottom: 1rem; border-radius: 0.75rem; border: 1px solid var(--glass-border); padding: 0.75rem 1.25rem; content-visibility: auto; contain-intrinsic-size: auto 3rem; }
+        details.src summary { cursor: pointer; font-weight: 700; }
+        details.src summary .muted { font-weight: 400; margin-left: 0.5rem; }
+        pre { background: rgba(0,0,0,0.05); padding: 1rem; border-radius: 0.5rem; overflow-x: auto; font-size: 0.75rem;
+              font-family: ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; white-space: pre-wrap; word-break: break-word; }
+        [data-theme="dark"] pre { background: rgba(255,255,255,0.05); }
+        .hidden { display: none; }
+    """
+
+    # Theme toggle, search and lazy source rendering. Source bodies live in inert JSON script
+    # blocks and only become DOM nodes when their section is opened.
+    OFFLINE_JS = """
+        const root = document.documentElement;
+        root.setAttribute('data-theme', localStorage.getItem('theme') || 'light');
+        document.getElementById('themeToggle').addEventListener('click', () => {
+            const theme = root.getAttribute('data-theme') === 'dark' ? 'light' : 'dark';
+            root.setAttribute('data-theme', theme);
+            localStorage.setItem('theme', theme);
+        });
+        const sourceText = (d) => JSON.parse(document.getElementById('src-' + d.dataset.idx).textContent);
+        document.querySelectorAll('details.src').forEach(d => d.addEventListener('toggle', () => {
+            if (d.open && !d.dataset.loaded) {
+                const pre = document.createElement('pre');
+                pre.textContent = sourceText(d);
+                d.appendChild(pre);
+                d.dataset.loaded = '1';
+            }
+        }));
+        let searchTimer;
+        document.getElementById('searchBar').addEventListener('input', (e) => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                const q = e.target.value.toLowerCase();
+                document.querySelectorAll('.content-section').forEach(s => s.classList.toggle('hidden', !!q && !s.textContent.toLowerCase().includes(q) && !s.querySelector('details.src')));
+                document.querySelectorAll('details.src').forEach(d => {
+                    const hit = !q || d.textContent.toLowerCase().includes(q) || sourceText(d).toLowerCase().includes(q);
+                    d.classList.toggle('hidden', !hit);
+                });
+            }, 150);
+        });
+    """
+
     def __init__(self, title="Knowledge Audit", theme="modern"):
         self.title = title
         self.theme = theme
         self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    def generate_html(self, content_list, conflicts=None):
-        """
-        Generates a standardized LCS Glassmorphism 2.0 HTML report.
-        Supports 'modern' (Tech) and 'ink' (Zen/Guoxue) themes.
-        """
-        log(f"Generating Glassmorphism 2.0 HTML report (Theme: {self.theme})...", "cyan")
-        
+    def _theme_assets(self):
+        """Returns (css_vars, font_link) for the current theme."""
         # Theme Variables Configuration
         if self.theme == "ink":
             # Ink & Zen Theme (Guoxue)
@@ -718,6 +2758,17 @@ class ReportGenerator:
             """
             font_link = '<link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap" rel="stylesheet">'
 
+        return css_vars, font_link
+
+    def generate_html(self, content_list, conflicts=None):
+        """
+        Generates a standardized LCS Glassmorphism 2.0 HTML report.
+        Supports 'modern' (Tech) and 'ink' (Zen/Guoxue) themes.
+        """
+        log(f"Generating Glassmorphism 2.0 HTML report (Theme: {self.theme})...", "cyan")
+        
+        css_vars, font_link = self._theme_assets()
+
         # Template for the report
         html_template = f"""<!DOCTYPE html>
 <html lang="zh-CN" data-theme="light">
@@ -840,87 +2891,421 @@ class ReportGenerator:
 </html>"""
         return html_template
 
+    def generate_offline_html(self, content_list, conflicts=None):
+        """
+        Streams a self-contained report (yields HTML chunks): inline precompiled CSS, only the
+        scripts the page uses, and source contents in collapsed sections rendered on demand.
+        Safe for air-gapped machines; nothing is fetched from the network.
+        """
+        log(f"Generating offline HTML report (Theme: {self.theme})...", "cyan")
+        css_vars, _ = self._theme_assets()
+        esc = html.escape
+
+        yield f"""<!DOCTYPE html>
+<html lang="zh-CN" data-theme="light">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{esc(self.title)} - LCS 真理审计报告</title>
+    <style>{css_vars}{self.OFFLINE_CSS}</style>
+</head>
+<body>
+    <nav class="glass-panel">
+        <span class="brand">{'☯️' if self.theme == 'ink' else '🧪'} LCS 审计</span>
+        <button id="themeToggle" type="button">🌓</button>
+        <input type="search" id="searchBar" placeholder="搜索内容...">
+        <div class="links"><a href="#overview">概览</a><a href="#conflicts">冲突</a><a href="#raw">源内容</a></div>
+    </nav>
+
+    <main>
+        <section id="overview" class="glass-panel content-section">
+            <h1>{esc(self.title)}</h1>
+            <p class="muted">审计时间: {self.timestamp} | 模式: {self.theme.upper()} | 来源: {len(content_list)}</p>
+        </section>
+
+        <section id="conflicts" class="glass-panel content-section">
+            <h2>🔍 冲突审计报告</h2>
+"""
+        for c in (conflicts or ["未检测到冲突"]):
+            yield f'            <div class="conflict">{esc(c)}</div>\n'
+
+        yield """        </section>
+
+        <section id="raw" class="glass-panel content-section">
+            <h2>📄 源内容存档</h2>
+"""
+        for i, c in enumerate(content_list):
+            title = next((line[7:].strip() for line in c.split("\n", 8)[:8] if line.startswith("Title: ")), "")
+            yield (f'            <details class="src" data-idx="{i}"><summary>来源 {i+1}'
+                   f'<span class="muted">{esc(title)} · {len(c):,} 字符</span></summary></details>\n')
+            # json.dumps escapes quotes/control chars; '<' is escaped so '</script>' cannot close the block
+            payload = json.dumps(c, ensure_ascii=False).replace("<", "\\u003c")
+            yield f'            <script type="application/json" id="src-{i}">{payload}</script>\n'
+
+        yield f"""        </section>
+    </main>
+
+    <script>{self.OFFLINE_JS}</script>
+</body>
+</html>"""
+
+# ==========================================
+# INGESTION DAEMON
+# ==========================================
+class IngestionDaemon:
+    """
+    Long-running ingestion server bound to 127.0.0.1. Keeps the ContentParser (OCR model,
+    pooled HTTP session, .doc converter) and the fallback browser warm across jobs.
+    Jobs run one at a time (each is parallel inside); the CLI is a thin client (run_via_daemon).
+
+    API (every request needs the X-Ingester-Token header from config/daemon.json):
+        GET  /health            -> {"ok": true, "pid": ...}
+        POST /jobs              -> {"id": ...}   body: {"argv": [...], "cwd": "..."}
+        GET  /jobs/<id>         -> status: queued | running | done | failed
+        GET  /jobs/<id>/result  -> the job's raw_content.txt, or .jsonl with --format jsonl
+        POST /shutdown
+    """
+    MAX_KEPT_JOBS = 20
+    OUTPUT_SUFFIXES = (".txt", ".jsonl", ".idx.json", ".html", "_feishu.md")
+
+    def __init__(self, port=0):
+        self.port = port
+        self.token = secrets.token_hex(16)
+        self.cp = ContentParser()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+        self.server = None
+
+    def submit(self, argv, cwd):
+        try:
+            args = build_arg_parser(QuietArgumentParser).parse_args(argv)
+        except ValueError as e:
+            raise ValueError(f"Invalid arguments {argv}: {e}")
+        if args.daemon or not args.inputs:
+            raise ValueError("No inputs given")
+        # Local paths are relative to the client's working directory
+        args.inputs = [os.path.join(cwd, inp) if os.path.exists(os.path.join(cwd, inp)) else inp for inp in args.inputs]
+
+        job = {"id": uuid.uuid4().hex[:12], "status": "queued", "inputs": args.inputs,
+               "submitted": time.time(), "started": None, "finished": None, "error": None, "result": None}
+        with self.lock:
+            self.jobs[job["id"]] = job
+            # Only finished jobs are pruned: a queued/running job may still be polled by its client
+            finished = [j for j, rec in self.jobs.items() if rec["status"] in ("done", "failed")]
+            for old_id in finished[:-self.MAX_KEPT_JOBS]:
+                shutil.rmtree(os.path.join(Config.get_config_dir(), "jobs", old_id), ignore_errors=True)
+                del self.jobs[old_id]
+        self.runner.submit(self._run, job, args)
+        return job
+
+    def _run(self, job, args):
+        job["status"], job["started"] = "running", time.time()
+        job_dir = os.path.join(Config.get_config_dir(), "jobs", job["id"])
+        os.makedirs(job_dir, exist_ok=True)
+        try:
+            output_path = os.path.join(job_dir, "raw_content.txt")
+            result = run_ingestion(args, cp=self.cp, output_path=output_path)
+            # Publish to the standard location the skill reads (as an in-process run would)
+            for suffix in self.OUTPUT_SUFFIXES:
+                src = output_path.replace(".txt", suffix)
+                if os.path.exists(src):
+                    shutil.copyfile(src, Config.get_output_path().replace(".txt", suffix))
+            result["output_path"] = Config.get_output_path().replace(".txt", os.path.splitext(result["output_path"])[1])
+            job["result"], job["status"] = result, "done"
+        except Exception as e:
+            job["error"], job["status"] = str(e), "failed"
+            log_error(f"Job {job['id']} failed: {e}")
+        finally:
+            job["finished"] = time.time()
+
+    def _make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send(self, code, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self):
+                if hmac.compare_digest(self.headers.get("X-Ingester-Token", ""), daemon.token):
+                    return True
+                self._send(403, {"error": "bad token"})
+                return False
+
+            def do_GET(self):
+                if not self._authorized(): return
+                parts = self.path.strip("/").split("/")
+                if parts == ["health"]:
+                    return self._send(200, {"ok": True, "pid": os.getpid(), "jobs": len(daemon.jobs)})
+                job = daemon.jobs.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+                if not job:
+                    return self._send(404, {"error": "not found"})
+                if len(parts) == 2:
+                    return self._send(200, job)
+                if parts[2:] == ["result"] and job["status"] == "done":
+                    path = os.path.join(Config.get_config_dir(), "jobs", job["id"], "raw_content.txt")
+                    if not os.path.exists(path): path = path.replace(".txt", ".jsonl")
+                    with open(path, "rb") as f:
+                        return self._send(200, f.read(), "text/plain")
+                return self._send(409, {"error": f"job is {job['status']}"})
+
+            def do_POST(self):
+                if not self._authorized(): return
+                if self.path == "/shutdown":
+                    self._send(200, {"ok": True})
+                    threading.Thread(target=daemon.server.shutdown, daemon=True).start()
+                    return
+                if self.path != "/jobs":
+                    return self._send(404, {"error": "not found"})
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                    job = daemon.submit(list(body["argv"]), body.get("cwd") or os.getcwd())
+                except (ValueError, KeyError, TypeError) as e:
+                    return self._send(400, {"error": str(e)})
+                log(f"Job {job['id']} queued: {len(job['inputs'])} input(s)")
+                self._send(202, {"id": job["id"]})
+
+        return Handler
+
+    def serve_forever(self):
+        log("Warming up: OCR engine, HTTP pool, PDF workers, browser keep-alive...", "cyan")
+        self.cp.get_ocr_engine()
+        if (os.cpu_count() or 1) > 1:
+            pool = self.cp.get_process_pool()
+            wait([pool.submit(os.getpid) for _ in range(os.cpu_count())])
+        BrowserDriver.keep_alive = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self._make_handler())
+        port = self.server.server_address[1]
+        Config.get_config_dir()  # ensure it exists
+        info_path = get_daemon_info_path()
+        # Owner-only from the first byte: the file holds the auth token
+        fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        if hasattr(os, "fchmod"): os.fchmod(fd, 0o600)  # an older file keeps its mode on O_CREAT
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"port": port, "token": self.token, "pid": os.getpid()}, f)
+
+        log_success(f"Ingestion daemon listening on 127.0.0.1:{port} (pid {os.getpid()}). Ctrl+C to stop.")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            try:
+                with open(info_path, "r", encoding="utf-8") as f:
+                    if json.load(f).get("pid") == os.getpid(): os.remove(info_path)
+            except (OSError, ValueError):
+                pass
+            self.runner.shutdown(wait=False, cancel_futures=True)
+            BrowserDriver.close()
+            log("Ingestion daemon stopped.")
+
+def stop_daemon():
+    try:
+        with open(get_daemon_info_path(), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        req = urllib.request.Request(f"http://127.0.0.1:{int(info['port'])}/shutdown", method="POST", data=b"",
+                                     headers={"X-Ingester-Token": info.get("token", "")})
+        urllib.request.urlopen(req, timeout=5).close()
+        log_success(f"Stopped daemon (pid {info.get('pid')}).")
+    except (OSError, ValueError, KeyError) as e:
+        log_warning(f"No running daemon found: {e}")
+
 # ==========================================
 # MAIN
 # ==========================================
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("inputs", nargs="+", help="One or more URLs or Local File Paths")
-    args = parser.parse_args()
-    
-    cp = ContentParser()
+def submit_inputs(cp, executor, inputs, include=None, exclude=None, max_in_flight=None, code_budget=None,
+                  source_timeout=None, run_token=None):
+    """
+    Submits every input to the shared executor. Directories and .zip archives fan out into
+    one job per member (walked lazily, with at most `max_in_flight` member jobs queued).
+    With `code_budget` set (code mode), local inputs are indexed as code in a single job each.
+    Every input gets a CancelToken (deadline `source_timeout`, child of `run_token`) shared by its jobs.
+    Returns (future_to_job, results_map, tokens); job is (input_idx, member_slot or None) and
+    container inputs get a ContainerResult in results_map up front.
+    """
+    future_to_job = {}
+    results_map = {}
+    tokens = {}
+    in_flight = threading.BoundedSemaphore(max_in_flight or 64)
+
+    for i, inp in enumerate(inputs):
+        token = tokens[i] = CancelToken(source_timeout, parent=run_token)
+        if code_budget and os.path.exists(inp):
+            future_to_job[executor.submit(cp.process_code, inp, include, exclude, code_budget, token)] = (i, None)
+        elif is_container(inp):
+            container = results_map[i] = ContainerResult(inp)
+            try:
+                for member in iter_container_members(inp, include, exclude):
+                    # Poll while waiting for a slot: queued jobs that ignore cancellation must not
+                    # keep the walk (and the run deadline in iter_completed) from moving on
+                    acquired = False
+                    while not acquired and not token.cancelled:
+                        acquired = in_flight.acquire(timeout=0.2)
+                    if token.cancelled:
+                        if acquired: in_flight.release()
+                        container.partial = f"{token.reason}; later members were not queued"
+                        break
+                    future = executor.submit(cp.process_member, member, token)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    future_to_job[future] = (i, container.add(member.label))
+            except Exception as e:
+                results_map[i] = f"Error reading container {inp}: {e}"
+                continue
+            log(f"{inp}: {len(container.members)} member(s) queued")
+        elif os.path.exists(inp) and os.path.isfile(inp):
+            future_to_job[executor.submit(cp.process_file, inp, token)] = (i, None)
+        else:
+            if not inp.startswith(('http://', 'https://')):
+                if not inp.startswith('http'):
+                    inp = 'https://' + inp
+            future_to_job[executor.submit(cp.process_url, inp, token)] = (i, None)
+    return future_to_job, results_map, tokens
+
+def collect_result(future, job, inputs, results_map, timeout_reason=None):
+    """
+    Stores a finished job's result (members go into their container slot). Returns True on success.
+    With `timeout_reason` the job was abandoned at its deadline and a marker is stored instead.
+    """
+    idx, slot = job
+    if timeout_reason:
+        res = f"Error: {Config.PARTIAL_MSG.format(reason=timeout_reason)}"
+        ok = False
+    else:
+        try:
+            res = future.result()
+            ok = True
+        except Exception as e:
+            res = f"Error processing input {inputs[idx]}: {e}"
+            ok = False
+    if slot is None:
+        results_map[idx] = res
+    else:
+        results_map[idx].members[slot][1] = res
+    return ok
+
+class QuietArgumentParser(argparse.ArgumentParser):
+    """Raises ValueError instead of printing usage and exiting (daemon: the error goes back to the client)."""
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message or f"parser exited with status {status}")
+
+def build_arg_parser(parser_class=argparse.ArgumentParser):
+    parser = parser_class()
+    parser.add_argument("inputs", nargs="*", help="One or more URLs, Local File Paths, Directories or .zip Archives")
+    parser.add_argument("--include", action="append", default=None, metavar="GLOB",
+                        help="Only ingest directory/zip members matching this glob (repeatable)")
+    parser.add_argument("--exclude", action="append", default=None, metavar="GLOB",
+                        help="Skip directory/zip members matching this glob (repeatable)")
+    parser.add_argument("--code", action="store_true",
+                        help="Index local files/directories/.zip as source code (outline, call graph, budgeted bodies)")
+    parser.add_argument("--code-budget", type=int, default=Config.MAX_CHARS_DEFAULT, metavar="CHARS",
+                        help="Max characters of function bodies included in code mode")
+    parser.add_argument("--source-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Per-source deadline; pages/images not reached in time are skipped and the result marked PARTIAL")
+    parser.add_argument("--run-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Deadline for the whole run; output is written with whatever finished (marked PARTIAL)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Start the browser fallback in parallel once an HTTP fetch is slower than usual (see --hedge-percentile)")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0, metavar="P",
+                        help="Latency percentile of past HTTP fetches (config/fetch_latency.json) that triggers hedging")
+    parser.add_argument("--web-ocr", action="store_true",
+                        help="OCR article images on web pages (code/formula/diagram screenshots) and splice the text in place")
+    parser.add_argument("--web-ocr-limit", type=int, default=20, metavar="N", help="Max images OCR'd per web page")
+    parser.add_argument("--format", choices=["txt", "jsonl", "both"], default="both",
+                        help="Output: flat raw_content.txt, structured raw_content.jsonl (+ .idx.json offset index), or both")
+    parser.add_argument("--show", metavar="SOURCE[:PAGE]",
+                        help="Print records of one source (optionally one page) from raw_content.jsonl via its index")
+    parser.add_argument("--offline-report", action="store_true",
+                        help="Write a self-contained HTML report (no CDN/fonts, lazily rendered sources)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run as a long-lived ingestion daemon on localhost (keeps OCR/browser/HTTP pools warm)")
+    parser.add_argument("--port", type=int, default=0, help="Daemon port (default: any free port)")
+    parser.add_argument("--no-daemon", action="store_true", help="Always run in-process, even if a daemon is running")
+    parser.add_argument("--stop-daemon", action="store_true", help="Stop the running daemon")
+    return parser
+
+def run_ingestion(args, cp=None, output_path=None):
+    """Runs one ingestion job and writes raw_content.txt/.jsonl plus reports. Returns a summary dict."""
+    started = time.time()
+    owns_parser = cp is None  # the daemon passes its own, kept warm across jobs
+    cp = cp or ContentParser()
     detector = ConflictDetector()
     
+    
     log(f"Starting ingestion for {len(args.inputs)} items...", style="cyan")
     
     # Define output path early
-    output_path = Config.get_output_path()
+    output_path = output_path or Config.get_output_path()
     
-    results_map = {}
     max_workers = os.cpu_count() or 4
     
-    raw_contents = []
     conflicts = []
+    run_token = CancelToken(args.run_timeout, name="run").start()
+    cp.hedge_percentile = args.hedge_percentile if args.hedge else None
+    cp.web_ocr_limit = args.web_ocr_limit if args.web_ocr else 0
+    # Not a `with` block: on a deadline, jobs that ignore cancellation must not hold up the output
+    executor = ThreadPoolExecutor(max_workers=max_workers)
     
-    if Progress:
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(bar_width=None, pulse_style="bright_blue"),
-            TaskProgressColumn(),
-            TimeRemainingColumn(),
-            console=console,
-            expand=True
-        ) as progress:
-            main_task = progress.add_task("[cyan]Overall Progress", total=len(args.inputs))
-            
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_input = {}
-                for i, inp in enumerate(args.inputs):
-                    if os.path.exists(inp) and os.path.isfile(inp):
-                        future_to_input[executor.submit(cp.process_file, inp)] = i
-                    else:
-                        if not inp.startswith(('http://', 'https://')):
-                            if not inp.startswith('http'):
-                                inp = 'https://' + inp
-                        future_to_input[executor.submit(cp.process_url, inp)] = i
+    try:
+        if Progress:
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(bar_width=None, pulse_style="bright_blue"),
+                TaskProgressColumn(),
+                TimeRemainingColumn(),
+                console=console,
+                expand=True
+            ) as progress:
+                main_task = progress.add_task("[cyan]Overall Progress", total=len(args.inputs))
                 
-                for future in as_completed(future_to_input):
-                    idx = future_to_input[future]
-                    try:
-                        res = future.result()
-                        results_map[idx] = res
-                        raw_contents.append(res)
-                        log_success(f"Completed: {args.inputs[idx][:50]}...")
-                    except Exception as e:
-                        results_map[idx] = f"Error processing input {args.inputs[idx]}: {e}"
-                        log_error(f"Failed: {args.inputs[idx][:50]}... Error: {e}")
+                future_to_job, results_map, tokens = submit_inputs(cp, executor, args.inputs, args.include, args.exclude, max_workers * 4,
+                                                                   args.code_budget if args.code else None, args.source_timeout, run_token)
+                progress.update(main_task, total=len(future_to_job))
+                
+                for future, (idx, slot), timeout_reason in iter_completed(future_to_job, tokens, run_token):
+                    name = args.inputs[idx] if slot is None else results_map[idx].members[slot][0]
+                    if collect_result(future, (idx, slot), args.inputs, results_map, timeout_reason):
+                        log_success(f"Completed: {name[:50]}...")
+                    elif timeout_reason:
+                        log_warning(f"Abandoned: {name[:50]}... ({timeout_reason})")
+                    else:
+                        log_error(f"Failed: {name[:50]}... Error: {future.exception()}")
                     progress.update(main_task, advance=1)
-    else:
-        # Fallback to tqdm or simple loop
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_input = {}
-            for i, inp in enumerate(args.inputs):
-                if os.path.exists(inp) and os.path.isfile(inp):
-                    future_to_input[executor.submit(cp.process_file, inp)] = i
-                else:
-                    if not inp.startswith(('http://', 'https://')):
-                        if not inp.startswith('http'):
-                            inp = 'https://' + inp
-                    future_to_input[executor.submit(cp.process_url, inp)] = i
+        else:
+            # Fallback to tqdm or simple loop
+            future_to_job, results_map, tokens = submit_inputs(cp, executor, args.inputs, args.include, args.exclude, max_workers * 4,
+                                                               args.code_budget if args.code else None, args.source_timeout, run_token)
             
-            iterable = as_completed(future_to_input)
+            iterable = iter_completed(future_to_job, tokens, run_token)
             if tqdm is not None:
-                iterable = tqdm(iterable, total=len(args.inputs), desc="Ingesting Content")
+                iterable = tqdm(iterable, total=len(future_to_job), desc="Ingesting Content")
                 
-            for future in iterable:
-                idx = future_to_input[future]
-                try:
-                    res = future.result()
-                    results_map[idx] = res
-                    raw_contents.append(res)
-                except Exception as e:
-                    results_map[idx] = f"Error processing input {args.inputs[idx]}: {e}"
+            for future, job, timeout_reason in iterable:
+                collect_result(future, job, args.inputs, results_map, timeout_reason)
+    finally:
+        # Stragglers see the cancellation at their next page/image boundary and exit on their own
+        run_token.cancel("run finished")
+        executor.shutdown(wait=False, cancel_futures=True)
+        cp.fetch_stats.save()
+        if owns_parser and cp.process_pool:
+            cp.process_pool.shutdown(wait=False, cancel_futures=True)
+    abandoned = sum(not f.done() for f in future_to_job)
+    
+    # Sources in input order; per-member order inside containers is the walk order
+    raw_contents = [as_text(results_map[i]) for i in range(len(args.inputs)) if i in results_map]
     
     # Run conflict detection if multi-source
     if len(raw_contents) > 1:
@@ -937,13 +3322,16 @@ def main():
         theme = "ink"
         log(f"Detected Guoxue/Cultural content. Switching to 'Ink & Zen' theme.", "magenta")
 
-    # Generate Glassmorphism 2.0 HTML report
+    # Generate HTML report (Glassmorphism 2.0, or the self-contained offline variant)
     rg = ReportGenerator(title="Multi-Source Knowledge Audit", theme=theme)
-    html_report = rg.generate_html(raw_contents, conflicts)
     html_report_path = output_path.replace(".txt", ".html")
     with open(html_report_path, "w", encoding="utf-8") as f:
-        f.write(html_report)
-    log_success(f"Glassmorphism 2.0 HTML report ({theme}) saved to: {html_report_path}")
+        if args.offline_report:
+            for chunk in rg.generate_offline_html(raw_contents, conflicts):
+                f.write(chunk)
+        else:
+            f.write(rg.generate_html(raw_contents, conflicts))
+    log_success(f"{'Offline' if args.offline_report else 'Glassmorphism 2.0'} HTML report ({theme}) saved to: {html_report_path}")
 
     # Generate Feishu-compatible Markdown report
     fg = FeishuMarkdownGenerator(title="Multi-Source Knowledge Audit")
@@ -953,27 +3341,36 @@ def main():
         f.write(feishu_md)
     log_success(f"Feishu-compatible Markdown saved to: {feishu_path}")
 
-    # Combine results
-    final_output = ""
-    for i in range(len(args.inputs)):
-        source_url = args.inputs[i]
-        content = results_map.get(i, "Error: Content missing")
-        
-        separator = f"\n\n" + "="*60 + "\n"
-        separator += f"--- SOURCE {i+1}: {source_url} ---\n"
-        separator += "="*60 + "\n\n"
-        
-        final_output += separator + content
-
-    # Add conflict report if exists
-    if len(args.inputs) in results_map:
-        final_output += "\n\n" + "="*60 + "\n" + results_map[len(args.inputs)] + "\n" + "="*60
-    
-    # output_path = Config.get_output_path() # Moved to top
+    # Write results source by source (text sources are streamed, never joined in memory)
+    jsonl_path = output_path.replace(".txt", ".jsonl")
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(final_output)
-        log_success(f"All content saved to: {output_path}")
+        if args.format in ("txt", "both"):
+            with open(output_path, "w", encoding="utf-8") as f:
+                for i in range(len(args.inputs)):
+                    source_url = args.inputs[i]
+                    content = results_map.get(i, "Error: Content missing")
+                    
+                    separator = f"\n\n" + "="*60 + "\n"
+                    separator += f"--- SOURCE {i+1}: {source_url} ---\n"
+                    separator += "="*60 + "\n\n"
+                    
+                    f.write(separator)
+                    write_result(f, content)
+
+                # Add conflict report if exists
+                if len(args.inputs) in results_map:
+                    f.write("\n\n" + "="*60 + "\n" + results_map[len(args.inputs)] + "\n" + "="*60)
+            log_success(f"All content saved to: {output_path}")
+
+        if args.format in ("jsonl", "both"):
+            with StructuredWriter(jsonl_path) as w:
+                for i in range(len(args.inputs)):
+                    w.write_source(i + 1, args.inputs[i], results_map.get(i))
+                if conflicts:
+                    w.write(None, None, _record("conflicts", "\n".join(conflicts), None))
+            log_success(f"Structured records saved to: {jsonl_path} (index: {w.index_path})")
+            if args.format == "jsonl":
+                output_path = jsonl_path
         
         if console:
             console.print(Panel(f"[bold green]Ingestion Complete![/bold green]\nProcessed [cyan]{len(args.inputs)}[/cyan] sources.", title="Success", expand=False))
@@ -981,5 +3378,41 @@ def main():
     except Exception as e:
         log_error(f"Failed to save output: {e}")
 
+    return {"output_path": output_path, "sources": len(args.inputs), "conflicts": len(conflicts),
+            "elapsed": time.time() - started, "abandoned": abandoned}
+
+def show_records(spec, path=None):
+    """--show SOURCE[:PAGE]: prints matching records from raw_content.jsonl without parsing the rest."""
+    source, _, page = spec.partition(":")
+    path = path or Config.get_output_path().replace(".txt", ".jsonl")
+    with StructuredReader(path) as reader:
+        for rec in reader.records(source=int(source), page=int(page) if page else None):
+            if rec["kind"] == "header": continue
+            where = " / ".join(str(x) for x in (rec["member"], rec["page"] and f"page {rec['page']}",
+                                                  rec["image"] and f"image {rec['image']}") if x)
+            print(f"--- [{rec['kind']}/{rec['origin']}] {rec['title'] or rec['url']}{' / ' + where if where else ''} ({rec['chars']} chars) ---")
+            print(rec["text"])
+
+def main():
+    parser = build_arg_parser()
+    args = parser.parse_args()
+
+    if args.stop_daemon:
+        return stop_daemon()
+    if args.show:
+        return show_records(args.show)
+    if args.daemon:
+        return IngestionDaemon(args.port).serve_forever()
+    if not args.inputs:
+        parser.error("at least one input is required")
+    summary = run_ingestion(args)
+    if summary["abandoned"]:
+        # Outputs are written and closed. Abandoned jobs may be stuck in a browser or OCR call
+        # that never checks its token; exiting normally would join their threads.
+        log_warning(f"Exiting without waiting for {summary['abandoned']} abandoned job(s).")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
 if __name__ == "__main__":
     main()